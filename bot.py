@@ -1,3 +1,8 @@
+import time
+
+# Начало запуска процесса для отчёта о времени запуска
+boot_started = time.perf_counter()
+
 import discord
 from discord.ext import commands
 import os
@@ -7,9 +12,8 @@ import traceback
 import datetime
 import sys
 import logging
-import importlib
-import time
 import fcntl
+import signal
 
 # Настройка логирования
 os.makedirs("logs", exist_ok=True)
@@ -27,40 +31,111 @@ logger = logging.getLogger("bot")
 load_dotenv()
 
 # Настройка бота
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix="!", intents=intents)
+sys.path.append('modules')
+from modules.guild_config import get_config, get_guild_cache
+from modules.metrics import http_trace
+
+config = get_config()
+
+# Только нужные события: сервер (каналы и роли), сообщения и их текст для
+# команд. Список участников не загружается, участники запрашиваются по мере надобности
+intents = discord.Intents.none()
+intents.guilds = True
+intents.guild_messages = True
+intents.message_content = True
+if config.sharding:
+    # Все шарды работают в этом процессе и распределяются автоматически
+    bot = commands.AutoShardedBot(
+        command_prefix="!",
+        intents=intents,
+        shard_count=config.shard_count,
+        http_trace=http_trace()
+    )
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents, http_trace=http_trace())
 
 # Время запуска отслеживания времени в игре
 start_time = int(time.time())
 
-# Импорт модулей
-sys.path.append('modules')
-from modules import shop_system
-from modules import admin_commands
-from modules import exchange_system
+# Модули бота подключаются как расширения discord.py; порядок важен:
+# админ-команды используют функции магазина
+from modules.metrics import metrics, start_metrics, startup, startup_phase
+from modules.persistence import flush_writes
+from modules.sales import get_sales
+
+EXTENSIONS = ("modules.shop_system", "modules.admin_commands", "modules.exchange_system")
+
+startup.record("imports", time.perf_counter() - boot_started)
+
+# Начало подключения к Discord, задаётся перед bot.run
+connect_started = None
+
+# Флаг однократной инициализации модулей за время работы процесса
+modules_initialized = False
+
+# Замер времени выполнения команд
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def stop_command_timer(ctx):
+    metrics.observe(f"command.{ctx.command.qualified_name}", time.perf_counter() - ctx.started_at)
 
 # Инициализация всех модулей
 async def initialize_modules():
     try:
         logger.info("Инициализация модулей...")
         
-        # Вызов функций инициализации из модулей
-        await shop_system.setup_shop(bot)
-        await admin_commands.setup_admin_commands(bot)
-        await exchange_system.setup_exchange_system(bot)
+        # Замер задержек и эндпоинт метрик
+        with startup_phase("metrics"):
+            await start_metrics()
+        
+        # Поиск категорий и ролей сервера до создания тикетов
+        with startup_phase("guild_cache"):
+            get_guild_cache().attach(bot)
+        
+        # Загрузка модулей
+        for extension in EXTENSIONS:
+            with startup_phase(extension):
+                await bot.load_extension(extension)
         
         logger.info("Все модули успешно загружены!")
+        logger.info(startup.finish(time.perf_counter() - boot_started))
     except Exception as e:
         logger.error(f"Ошибка при инициализации модулей: {e}")
         traceback.print_exc()
 
+# Задача остановки бота по SIGTERM
+shutdown_task = None
+
+def request_shutdown():
+    global shutdown_task
+    if shutdown_task is None:
+        logger.info("Получен SIGTERM, завершение работы...")
+        shutdown_task = asyncio.create_task(bot.close())
+
+# Остановка по SIGTERM (kill PID) идёт тем же путём, что и по Ctrl+C:
+# выгрузка модулей и запись отложенных изменений
+@bot.event
+async def setup_hook():
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, request_shutdown)
+
 # Обработчик события готовности
 @bot.event
 async def on_ready():
+    global modules_initialized
     logger.info(f"Бот {bot.user.name} успешно запущен!")
     
-    # Инициализация модулей
-    await initialize_modules()
+    # on_ready вызывается при каждом переподключении к шлюзу,
+    # а модули инициализируются только при первом
+    if not modules_initialized:
+        modules_initialized = True
+        if connect_started is not None:
+            startup.record("connect", time.perf_counter() - connect_started)
+        await initialize_modules()
+    else:
+        logger.info("Повторное подключение, модули уже инициализированы")
     
     # Установка статуса с временем начала активности
     await bot.change_presence(
@@ -98,12 +173,22 @@ async def admin_help_command(ctx):
     embed.add_field(
         name="🛠️ Управление ботом",
         value="!restart - Перезапустить модули бота\n"
+              "!stats - Задержки обработчиков и запросов\n"
               "!close - Закрыть тикет\n"
               "!embed <заголовок> | <описание> - Создать эмбед\n"
               "!say <сообщение> - Отправить сообщение от имени бота",
         inline=False
     )
     
+    # Раздел поиска товаров
+    embed.add_field(
+        name="🔎 Товары",
+        value="/edititem <название> - Найти и редактировать товар\n"
+              "/deleteitem <название> - Найти и удалить товар\n"
+              "!sales [дни] - Статистика продаж",
+        inline=False
+    )
+    
     # Раздел системы обмена
     embed.add_field(
         name="🔄 Система обмена",
@@ -123,16 +208,15 @@ async def restart_modules(ctx):
     """Перезапуск модулей бота"""
     try:
         message = await ctx.send("🔄 Перезапуск модулей...")
+        started = time.perf_counter()
         
-        # Перезагрузка модулей
-        importlib.reload(sys.modules['modules.shop_system'])
-        importlib.reload(sys.modules['modules.admin_commands'])
-        importlib.reload(sys.modules['modules.exchange_system'])
+        # Старая версия модуля снимает свои команды, слушатели и кнопки и
+        # передаёт состояние новой; при ошибке загрузки остаётся старая версия
+        for extension in EXTENSIONS:
+            await bot.reload_extension(extension)
         
-        # Инициализация модулей заново
-        await initialize_modules()
-        
-        await message.edit(content="✅ Модули успешно перезапущены!")
+        elapsed = (time.perf_counter() - started) * 1000
+        await message.edit(content=f"✅ Модули успешно перезапущены за {elapsed:.0f} мс!")
         logger.info("Модули успешно перезапущены администратором")
     except Exception as e:
         logger.error(f"Ошибка при перезапуске модулей: {e}")
@@ -167,7 +251,14 @@ if __name__ == "__main__":
         os.makedirs("data/exchanges", exist_ok=True)
         
         logger.info("Запуск бота...")
-        bot.run(token)
+        connect_started = time.perf_counter()
+        try:
+            bot.run(token)
+        finally:
+            # Запись отложенных изменений при завершении работы; корзины
+            # записываются при выгрузке модуля магазина
+            get_sales().flush()
+            flush_writes()
     except Exception as e:
         logger.critical(f"Критическая ошибка при запуске бота: {e}")
         print(f"❌ Критическая ошибка: {e}")
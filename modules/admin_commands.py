@@ -1,98 +1,330 @@
 import discord
 from discord.ext import commands
+from discord import app_commands
 from discord.ui import Button, View, Modal, TextInput, Select
 import json
-import os
 import asyncio
 
 #Импорт данных из модуля магазина
-from modules.shop_system import shop_items, save_shop_data, update_shop
+from modules.shop_system import request_shop_update
+from modules.catalog import get_catalog
+from modules.dispatcher import get_dispatcher
+from modules.panels import publish_panel
+from modules.guild_config import get_config, get_guild_cache
+from modules.ticket_registry import get_order_registry
+from modules.sales import get_sales
+from modules.metrics import metrics, timed
+from modules.lifecycle import add_persistent_view, drain_views, hand_off_state, take_over_state
+
+# Настройки и объекты сервера, найденные при запуске
+config = get_config()
+guild_cache = get_guild_cache()
+
+# Каталог, открытые заказы и статистика продаж привязываются при
+# настройке модуля
+catalog = None
+order_registry = None
+sales = None
+
+def bind_services():
+    """Получение общих объектов процесса"""
+    global catalog, order_registry, sales
+    catalog = get_catalog()
+    order_registry = get_order_registry()
+    sales = get_sales()
+
+# Задачи отчёта об обновлении магазина, ещё не завершившиеся
+report_tasks = set()
+
+@timed("shop.report_update")
+async def report_shop_update(interaction):
+    """Ожидание фонового обновления магазина и отчёт администратору"""
+    try:
+        if await request_shop_update(interaction.client):
+            await interaction.followup.send("🔄 Магазин обновлён.", ephemeral=True)
+        else:
+            await interaction.followup.send("❗ Магазин не обновлён: канал магазина не найден.", ephemeral=True)
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка при обновлении магазина: {e}", ephemeral=True)
+
+def schedule_shop_report(interaction):
+    """Отчёт об обновлении магазина отдельной задачей
+
+    Обработчик взаимодействия завершается сразу после ответа, поэтому его
+    замер не включает время обновления магазина.
+    """
+    task = asyncio.create_task(report_shop_update(interaction))
+    report_tasks.add(task)
+    task.add_done_callback(report_tasks.discard)
 
 class AdminPanelView(View):
     def __init__(self):
         super().__init__(timeout=None)
 
-    @discord.ui.button(label="Добавить товар", style=discord.ButtonStyle.green)
+    @discord.ui.button(label="Добавить товар", style=discord.ButtonStyle.green, custom_id="admin_add_item")
+    @timed("interaction.AdminPanelView.add_item")
     async def add_item(self, interaction: discord.Interaction, button: Button):
         modal = AddItemModal()
         await interaction.response.send_modal(modal)
 
-    @discord.ui.button(label="Редактировать товар", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="Редактировать товар", style=discord.ButtonStyle.primary, custom_id="admin_edit_item")
+    @timed("interaction.AdminPanelView.edit_item")
     async def edit_item(self, interaction: discord.Interaction, button: Button):
-        if not shop_items:
+        if not catalog:
             await interaction.response.send_message("❗ В магазине нет товаров для редактирования.", ephemeral=True)
             return
 
-        select_view = EditItemSelectView()
-        await interaction.response.send_message("Выберите товар для редактирования:", view=select_view, ephemeral=True)
+        select_view = ItemPickerView(EditItemSelect, interaction.client)
+        await interaction.response.send_message("Выберите товар для редактирования (или используйте `/edititem`):", view=select_view, ephemeral=True)
 
-    @discord.ui.button(label="Удалить товар", style=discord.ButtonStyle.danger)
+    @discord.ui.button(label="Удалить товар", style=discord.ButtonStyle.danger, custom_id="admin_delete_item")
+    @timed("interaction.AdminPanelView.delete_item")
     async def delete_item(self, interaction: discord.Interaction, button: Button):
-        if not shop_items:
+        if not catalog:
             await interaction.response.send_message("❗ В магазине нет товаров для удаления.", ephemeral=True)
             return
 
-        select_view = DeleteItemSelectView()
-        await interaction.response.send_message("Выберите товар для удаления:", view=select_view, ephemeral=True)
+        select_view = ItemPickerView(DeleteItemSelect, interaction.client)
+        await interaction.response.send_message("Выберите товар для удаления (или используйте `/deleteitem`):", view=select_view, ephemeral=True)
 
-    @discord.ui.button(label="Показать ID товаров", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="Показать ID товаров", style=discord.ButtonStyle.secondary, custom_id="admin_show_ids")
+    @timed("interaction.AdminPanelView.show_item_ids")
     async def show_item_ids(self, interaction: discord.Interaction, button: Button):
-        if not shop_items:
+        if not catalog:
             await interaction.response.send_message("❗ В магазине нет товаров.", ephemeral=True)
             return
 
-        item_list = "\n".join([f"🔹 {item['name']} — ID: {item['id']}, Канал: {item.get('channel_id', 'Основной')}" for item in shop_items])
-        embed = discord.Embed(title="📜 Список товаров", description=item_list, color=discord.Color.blue())
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        view = ItemListView()
+        await interaction.response.send_message(embed=view.embed, view=view, ephemeral=True)
+
+    @discord.ui.button(label="📊 Продажи", style=discord.ButtonStyle.secondary, custom_id="admin_sales")
+    @timed("interaction.AdminPanelView.show_sales")
+    async def show_sales(self, interaction: discord.Interaction, button: Button):
+        await interaction.response.send_message(embed=sales_report_embed(), ephemeral=True)
+
+def sales_report_embed(days=7):
+    """Эмбед со сводкой продаж из накопленной статистики"""
+    stats = sales.stats
+    embed = discord.Embed(title="📊 Статистика продаж", color=discord.Color.gold())
+    embed.add_field(name="Заказов", value=str(stats["orders"]), inline=True)
+    embed.add_field(name="Выручка", value=f'{stats["revenue"]}р', inline=True)
+    embed.add_field(name="Средний чек", value=f'{sales.average_basket()}р', inline=True)
+
+    top_items = sales.top_items(limit=10)
+    embed.add_field(
+        name="🏆 Лучшие товары",
+        value="\n".join(f"{place}. {name} — {quantity} шт., {revenue}р"
+                        for place, (name, quantity, revenue) in enumerate(top_items, 1)) or "Нет продаж",
+        inline=False
+    )
+
+    day_lines = []
+    for date in sales.recent_days(days):
+        day = sales.day(date)
+        leader = max(day["items"].items(), key=lambda entry: entry[1][1], default=None)
+        leader_text = f", лидер: {sales.stats['items'][leader[0]]['name']}" if leader else ""
+        day_lines.append(f"{date}: {day['orders']} зак., {day['revenue']}р{leader_text}")
+    embed.add_field(name=f"📅 Дни с заказами за {days} дн.", value="\n".join(day_lines) or "Нет продаж", inline=False)
 
-class EditItemSelectView(View):
-    def __init__(self):
-        super().__init__()
-        self.add_item(EditItemSelect())
+    recent_top = sales.top_items(limit=5, days=days)
+    if recent_top:
+        embed.add_field(
+            name=f"📦 Лучшие товары за {days} дн.",
+            value="\n".join(f"{name} — {quantity} шт., {revenue}р" for name, quantity, revenue in recent_top),
+            inline=False
+        )
+    return embed
+
+def stats_embed(limit=20):
+    """Эмбед с задержками обработчиков и запросов (p50/p95/p99 в мс)"""
+    snapshot = metrics.snapshot()
+    ranked = sorted(snapshot.items(), key=lambda entry: entry[1][0], reverse=True)[:limit]
+    lines = [
+        f"`{name}` ×{count}: {p50 * 1000:.0f} / {p95 * 1000:.0f} / {p99 * 1000:.0f} мс"
+        for name, (count, p50, p95, p99, _) in ranked
+    ]
+    embed = discord.Embed(
+        title="⏱ Задержки (p50 / p95 / p99)",
+        description="\n".join(lines)[:4096] or "Нет данных",
+        color=discord.Color.blue()
+    )
+    embed.add_field(name="Ответов 429", value=str(metrics.counters.get("rest.rate_limited", 0)), inline=True)
+    loop_lag = snapshot.get("loop.lag")
+    if loop_lag:
+        embed.add_field(
+            name="Задержка цикла событий",
+            value=f"p99 {loop_lag[3] * 1000:.1f} мс, макс. {loop_lag[4] * 1000:.1f} мс",
+            inline=True
+        )
+    return embed
+
+# Количество товаров на одной странице выбора (лимит Discord для Select)
+ITEMS_PER_PAGE = 25
+ALL_CHANNELS = "all"
+MAIN_CHANNEL = "main"
+
+@timed("interaction.open_edit_modal")
+async def open_edit_modal(interaction, item_id):
+    """Открытие формы редактирования товара"""
+    item = catalog.get(item_id)
+    if not item:
+        await interaction.response.send_message(f"❗ Ошибка: товар с ID {item_id} не найден!", ephemeral=True)
+        return
+    await interaction.response.send_modal(EditItemModal(item))
+
+@timed("interaction.confirm_delete")
+async def confirm_delete(interaction, item_id):
+    """Запрос подтверждения удаления товара"""
+    item = catalog.get(item_id)
+    if not item:
+        await interaction.response.send_message(f"❗ Ошибка: товар с ID {item_id} не найден!", ephemeral=True)
+        return
+
+    # Создание подтверждающего сообщения
+    embed = discord.Embed(
+        title="⚠️ Подтверждение удаления",
+        description=f"Вы уверены, что хотите удалить товар **{item['name']}** (ID: {item['id']})?",
+        color=discord.Color.red()
+    )
+
+    # Создаение кнопки подтверждения
+    confirm_view = ConfirmDeleteView(item["id"])
+    await interaction.response.send_message(embed=embed, view=confirm_view, ephemeral=True)
+
+class ItemListView(View):
+    """Постраничный список товаров с их ID
+
+    На странице ITEMS_PER_PAGE товаров с укороченными названиями, поэтому
+    описание эмбеда не превышает лимит Discord при любом размере каталога.
+    """
+
+    def __init__(self, page=0):
+        super().__init__(timeout=300)
+        self.page = page
+        self.previous_button = Button(label="◀", style=discord.ButtonStyle.secondary)
+        self.previous_button.callback = self.previous_page
+        self.next_button = Button(label="▶", style=discord.ButtonStyle.secondary)
+        self.next_button.callback = self.next_page
+        self.add_item(self.previous_button)
+        self.add_item(self.next_button)
+        self.render()
+        # Для одной страницы кнопки не нужны
+        if self.previous_button.disabled and self.next_button.disabled:
+            self.clear_items()
+
+    def render(self):
+        items = list(catalog)
+        page_count = max(1, (len(items) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
+        self.page = min(max(self.page, 0), page_count - 1)
+        page_items = items[self.page * ITEMS_PER_PAGE:(self.page + 1) * ITEMS_PER_PAGE]
+        item_list = "\n".join(
+            f"🔹 {item['name'][:100]} — ID: {item['id']}, Канал: {item.get('channel_id', 'Основной')}"
+            for item in page_items
+        )
+        self.embed = discord.Embed(title="📜 Список товаров", description=item_list or "Нет товаров", color=discord.Color.blue())
+        self.embed.set_footer(text=f"Стр. {self.page + 1}/{page_count} • товаров: {len(items)}")
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= page_count - 1
+
+    async def show(self, interaction, page):
+        self.page = page
+        self.render()
+        await interaction.response.edit_message(embed=self.embed, view=self)
+
+    async def previous_page(self, interaction: discord.Interaction):
+        await self.show(interaction, self.page - 1)
+
+    async def next_page(self, interaction: discord.Interaction):
+        await self.show(interaction, self.page + 1)
+
+class ItemPickerView(View):
+    """Постраничный выбор товара с фильтром по каналу"""
+
+    def __init__(self, select_class, client, page=0, channel_filter=ALL_CHANNELS):
+        super().__init__(timeout=300)
+        self.select_class = select_class
+        self.client = client
+        self.channel_filter = channel_filter
+
+        if channel_filter == ALL_CHANNELS:
+            items = list(catalog)
+        elif channel_filter == MAIN_CHANNEL:
+            items = catalog.in_channel(None)
+        else:
+            items = catalog.in_channel(int(channel_filter))
+
+        self.page_count = max(1, (len(items) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
+        self.page = min(max(page, 0), self.page_count - 1)
+        page_items = items[self.page * ITEMS_PER_PAGE:(self.page + 1) * ITEMS_PER_PAGE]
+
+        if page_items:
+            self.add_item(select_class(page_items))
+
+        # Фильтр по каналам показывается, только если товары есть в нескольких каналах
+        if len(catalog.by_channel) > 1:
+            self.add_item(ChannelFilterSelect(self))
+
+        if self.page_count > 1:
+            previous_button = Button(label="◀", style=discord.ButtonStyle.secondary, disabled=self.page == 0, row=2)
+            previous_button.callback = self.previous_page
+            page_label = Button(label=f"Стр. {self.page + 1}/{self.page_count}", style=discord.ButtonStyle.secondary, disabled=True, row=2)
+            next_button = Button(label="▶", style=discord.ButtonStyle.secondary, disabled=self.page >= self.page_count - 1, row=2)
+            next_button.callback = self.next_page
+            self.add_item(previous_button)
+            self.add_item(page_label)
+            self.add_item(next_button)
+
+    async def show(self, interaction, page, channel_filter):
+        view = ItemPickerView(self.select_class, self.client, page, channel_filter)
+        await interaction.response.edit_message(view=view)
+
+    async def previous_page(self, interaction: discord.Interaction):
+        await self.show(interaction, self.page - 1, self.channel_filter)
+
+    async def next_page(self, interaction: discord.Interaction):
+        await self.show(interaction, self.page + 1, self.channel_filter)
+
+class ChannelFilterSelect(discord.ui.Select):
+    def __init__(self, picker):
+        self.picker = picker
+        options = [discord.SelectOption(label="Все товары", value=ALL_CHANNELS, default=picker.channel_filter == ALL_CHANNELS)]
+        for channel_id in catalog.by_channel:
+            value = MAIN_CHANNEL if channel_id is None else str(channel_id)
+            if channel_id is None:
+                label = "Основной канал"
+            else:
+                channel = picker.client.get_channel(int(channel_id))
+                label = f"#{channel.name}" if channel else f"Канал {channel_id}"
+            options.append(discord.SelectOption(label=label[:100], value=value, default=picker.channel_filter == value))
+        super().__init__(placeholder="Фильтр по каналу", options=options[:ITEMS_PER_PAGE], row=1)
+
+    @timed("interaction.ChannelFilterSelect.callback")
+    async def callback(self, interaction: discord.Interaction):
+        await self.picker.show(interaction, 0, self.values[0])
 
 class EditItemSelect(discord.ui.Select):
-    def __init__(self):
+    def __init__(self, items):
         options = [
-            discord.SelectOption(label=item["name"], value=str(item["id"]), description=f"ID: {item['id']}")
-            for item in shop_items
+            discord.SelectOption(label=item["name"][:100], value=str(item["id"]), description=f"ID: {item['id']}")
+            for item in items
         ]
-        super().__init__(placeholder="Выберите товар", options=options)
+        super().__init__(placeholder="Выберите товар", options=options, row=0)
 
+    @timed("interaction.EditItemSelect.callback")
     async def callback(self, interaction: discord.Interaction):
-        item_id = int(self.values[0])
-        item = next((item for item in shop_items if item["id"] == item_id), None)
-        if item:
-            modal = EditItemModal(item)
-            await interaction.response.send_modal(modal)
-
-class DeleteItemSelectView(View):
-    def __init__(self):
-        super().__init__()
-        self.add_item(DeleteItemSelect())
+        await open_edit_modal(interaction, int(self.values[0]))
 
 class DeleteItemSelect(discord.ui.Select):
-    def __init__(self):
+    def __init__(self, items):
         options = [
-            discord.SelectOption(label=item["name"], value=str(item["id"]), description=f"ID: {item['id']}")
-            for item in shop_items
+            discord.SelectOption(label=item["name"][:100], value=str(item["id"]), description=f"ID: {item['id']}")
+            for item in items
         ]
-        super().__init__(placeholder="Выберите товар для удаления", options=options)
+        super().__init__(placeholder="Выберите товар для удаления", options=options, row=0)
 
+    @timed("interaction.DeleteItemSelect.callback")
     async def callback(self, interaction: discord.Interaction):
-        item_id = int(self.values[0])
-        item = next((item for item in shop_items if item["id"] == item_id), None)
-        
-        if item:
-            # Создание подтверждающего сообщения
-            embed = discord.Embed(
-                title="⚠️ Подтверждение удаления",
-                description=f"Вы уверены, что хотите удалить товар **{item['name']}** (ID: {item['id']})?",
-                color=discord.Color.red()
-            )
-            
-            # Создаение кнопки подтверждения
-            confirm_view = ConfirmDeleteView(item_id)
-            await interaction.response.send_message(embed=embed, view=confirm_view, ephemeral=True)
+        await confirm_delete(interaction, int(self.values[0]))
 
 class ConfirmDeleteView(View):
     def __init__(self, item_id):
@@ -100,22 +332,22 @@ class ConfirmDeleteView(View):
         self.item_id = item_id
 
     @discord.ui.button(label="Да, удалить", style=discord.ButtonStyle.danger)
+    @timed("interaction.ConfirmDeleteView.confirm")
     async def confirm(self, interaction: discord.Interaction, button: Button):
-        item = next((i for i in shop_items if i["id"] == self.item_id), None)
+        item = catalog.remove(self.item_id)
         
         if not item:
             await interaction.response.send_message(f"❗ Ошибка: товар с ID {self.item_id} не найден!", ephemeral=True)
             return
         
         item_name = item['name']
-        shop_items.remove(item)
-        save_shop_data()
-        await update_shop(interaction.client)
         
-        await interaction.response.send_message(f"✅ Товар **{item_name}** (ID: {self.item_id}) удалён!", ephemeral=True)
+        await interaction.response.send_message(f"✅ Товар **{item_name}** (ID: {self.item_id}) удалён! Магазин обновляется...", ephemeral=True)
         self.stop()
+        schedule_shop_report(interaction)
 
     @discord.ui.button(label="Отмена", style=discord.ButtonStyle.secondary)
+    @timed("interaction.ConfirmDeleteView.cancel")
     async def cancel(self, interaction: discord.Interaction, button: Button):
         await interaction.response.send_message("❌ Удаление отменено.", ephemeral=True)
         self.stop()
@@ -139,6 +371,7 @@ class AddItemModal(Modal, title="Добавить товар"):
         self.add_item(self.description)
         self.add_item(self.image_and_channel)
 
+    @timed("interaction.AddItemModal.on_submit")
     async def on_submit(self, interaction: discord.Interaction):
         try:
             price = int(self.price.value)
@@ -165,27 +398,19 @@ class AddItemModal(Modal, title="Добавить товар"):
             await interaction.response.send_message(f"❗ Ошибка: {str(e)}", ephemeral=True)
             return
 
-        # Генерация ID товара
-        new_id = 1
-        if shop_items:
-            new_id = max(item["id"] for item in shop_items) + 1
-
-        new_item = {
-            "id": new_id,
-            "name": self.name.value,
-            "price": price,
-            "discount": discount,
-            "description": self.description.value if self.description.value.strip() else None,
-            "image": image_url,
-            "channel_id": channel_id
-        }
-
-        shop_items.append(new_item)
-        save_shop_data()
-        await update_shop(interaction.client)
+        # ID товара выдаётся каталогом
+        catalog.add(
+            name=self.name.value,
+            price=price,
+            discount=discount,
+            description=self.description.value if self.description.value.strip() else None,
+            image=image_url,
+            channel_id=channel_id
+        )
 
         channel_info = f" в канал с ID {channel_id}" if channel_id else ""
-        await interaction.response.send_message(f"✅ Товар **{self.name.value}** добавлен{channel_info}!", ephemeral=True)
+        await interaction.response.send_message(f"✅ Товар **{self.name.value}** добавлен{channel_info}! Магазин обновляется...", ephemeral=True)
+        schedule_shop_report(interaction)
 
 class EditItemModal(Modal, title="Редактировать товар"):
     def __init__(self, item):
@@ -216,6 +441,7 @@ class EditItemModal(Modal, title="Редактировать товар"):
         self.add_item(self.description)
         self.add_item(self.image_and_channel)
 
+    @timed("interaction.EditItemModal.on_submit")
     async def on_submit(self, interaction: discord.Interaction):
         try:
             price = int(self.price.value)
@@ -242,30 +468,38 @@ class EditItemModal(Modal, title="Редактировать товар"):
             await interaction.response.send_message(f"❗ Ошибка: {str(e)}", ephemeral=True)
             return
 
-        item = next((i for i in shop_items if i["id"] == self.item_id), None)
+        item = catalog.update(
+            self.item_id,
+            name=self.name.value,
+            price=price,
+            discount=discount,
+            description=self.description.value if self.description.value.strip() else None,
+            image=image_url,
+            channel_id=channel_id
+        )
         if item:
-            item["name"] = self.name.value
-            item["price"] = price
-            item["discount"] = discount
-            item["description"] = self.description.value if self.description.value.strip() else None
-            item["image"] = image_url
-            item["channel_id"] = channel_id
-            
-            save_shop_data()
-            await update_shop(interaction.client)
-            
             channel_info = f" в канал с ID {channel_id}" if channel_id else ""
-            await interaction.response.send_message(f"✅ Товар **{self.name.value}** обновлён{channel_info}!", ephemeral=True)
+            await interaction.response.send_message(f"✅ Товар **{self.name.value}** обновлён{channel_info}! Магазин обновляется...", ephemeral=True)
+            schedule_shop_report(interaction)
+
+@timed("shop.update_admin_panel")
+async def update_admin_panel(bot, force=False):
+    """Обновление админ-панели
 
-async def update_admin_panel(bot):
-    """Обновление админ-панели"""
-    admin_channel_id = int(os.getenv("ADMIN_CHANNEL_ID"))
+    Панель публикуется заново только если её содержимое изменилось
+    или при force=True (с очисткой канала).
+    """
+    admin_channel_id = config.admin_channel_id
     channel = bot.get_channel(admin_channel_id)
     
     if not channel:
         return
     
-    await channel.purge()
+    async def cleanup():
+        # Очистка канала пачками через общую очередь запросов
+        message_ids = [message.id async for message in channel.history(limit=100)]
+        await get_dispatcher().bulk_delete(channel, message_ids)
+    
     embed = discord.Embed(
         title="🔧 Админ-меню", 
         description="Управление магазином", 
@@ -274,12 +508,88 @@ async def update_admin_panel(bot):
     embed.set_footer(text="✨ Powered by MrFolium ✨")
     
     view = AdminPanelView()
-    await channel.send(embed=embed, view=view)
+    await publish_panel(channel, "admin", embed, view, cleanup, force=force)
+
+
+async def item_autocomplete(interaction: discord.Interaction, current: str):
+    """Подсказки товаров по началу названия"""
+    return [
+        app_commands.Choice(name=f"{item['name']} (ID: {item['id']})"[:100], value=str(item["id"]))
+        for item in catalog.search(current)
+    ]
+
+@app_commands.command(name="edititem", description="Редактировать товар")
+@app_commands.describe(item="Начните вводить название товара")
+@app_commands.autocomplete(item=item_autocomplete)
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+async def edit_item_slash(interaction: discord.Interaction, item: str):
+    if not item.isdigit():
+        await interaction.response.send_message("❗ Выберите товар из списка подсказок.", ephemeral=True)
+        return
+    await open_edit_modal(interaction, int(item))
+
+@app_commands.command(name="deleteitem", description="Удалить товар")
+@app_commands.describe(item="Начните вводить название товара")
+@app_commands.autocomplete(item=item_autocomplete)
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+async def delete_item_slash(interaction: discord.Interaction, item: str):
+    if not item.isdigit():
+        await interaction.response.send_message("❗ Выберите товар из списка подсказок.", ephemeral=True)
+        return
+    await confirm_delete(interaction, int(item))
+
+async def setup_slash_commands(bot, sync=True):
+    """Регистрация слеш-команд поиска товаров на сервере
 
+    sync=False только добавляет обработчики: команды уже известны Discord.
+    Без GUILD_ID слеш-команды не регистрируются, остальные команды работают.
+    """
+    if config.guild_id is None:
+        print("❌ GUILD_ID не задан или не является числом, слеш-команды поиска товаров не зарегистрированы")
+        return
+    guild = discord.Object(id=config.guild_id)
+    bot.tree.add_command(edit_item_slash, guild=guild, override=True)
+    bot.tree.add_command(delete_item_slash, guild=guild, override=True)
+    if not sync:
+        return
+    try:
+        await bot.tree.sync(guild=guild)
+    except Exception as e:
+        print(f"Ошибка при синхронизации слеш-команд: {e}")
+
+async def find_member(guild, user_id=None, name=None):
+    """Участник сервера из кеша или, если его там нет, запросом к Discord
+
+    Список участников не загружается при запуске, поэтому в кеше есть
+    только участники, которые недавно взаимодействовали с ботом.
+    """
+    if user_id is not None:
+        member = guild.get_member(user_id)
+        if member is None:
+            try:
+                member = await guild.fetch_member(user_id)
+            except discord.NotFound:
+                return None
+        return member
+    member = guild.get_member_named(name)
+    if member is None:
+        members = await guild.query_members(query=name, limit=5)
+        member = next((candidate for candidate in members if candidate.name == name), None)
+    return member
 
 async def setup_admin_commands(bot):
     """Настройка админ-команд"""
+    bind_services()
+
+    # При перезагрузке модуля слеш-команды уже синхронизированы с Discord
+    reloaded = take_over_state(bot, __name__) is not None
+
+    # Постоянная админ-панель продолжает работать после перезапуска
+    add_persistent_view(bot, __name__, AdminPanelView())
     await update_admin_panel(bot)
+    await setup_slash_commands(bot, sync=not reloaded)
 
     @bot.command(name="say")
     @commands.has_permissions(administrator=True)
@@ -308,18 +618,24 @@ async def setup_admin_commands(bot):
     @bot.command(name="close")
     @commands.has_permissions(administrator=True)
     async def close_ticket(ctx):
-        if not ctx.channel.name.startswith('заказ-'):
+        order_info = order_registry.get(ctx.channel.id)
+        if order_info:
+            ticket_user = await find_member(ctx.guild, user_id=order_info["buyer_id"])
+        elif ctx.channel.name.startswith('заказ-'):
+            # Тикеты, созданные до появления реестра заказов, определяются по названию канала
+            ticket_user = await find_member(ctx.guild, name=ctx.channel.name.replace('заказ-', ''))
+        else:
             await ctx.send("❗ Эта команда работает только в тикетах!")
             return
 
-        review_channel_id = int(os.getenv("REVIEW_CHANNEL_ID"))
-        review_channel = bot.get_channel(review_channel_id)
-
-        ticket_user = ctx.guild.get_member_named(ctx.channel.name.replace('заказ-', ''))
+        review_channel = bot.get_channel(config.review_channel_id)
 
         if ticket_user and review_channel:
+            # Заказ переносится в историю до запросов к Discord
+            order_registry.close(ctx.channel.id, ctx.author.id)
+
             try:
-                member_role = discord.utils.get(ctx.guild.roles, name="Участник")
+                member_role = guild_cache.member_role
                 if member_role:
                     await ticket_user.add_roles(member_role)
                     await ctx.send(f"✅ Роль 'Участник' выдана пользователю {ticket_user.mention}")
@@ -348,24 +664,31 @@ async def setup_admin_commands(bot):
             if isinstance(error, commands.MissingPermissions):
                 await ctx.send("❌ У вас нет прав на выполнение этой команды!")
 
+    @bot.command(name="sales")
+    @commands.has_permissions(administrator=True)
+    async def show_sales(ctx, days: int = 7):
+        """Сводка продаж без чтения истории заказов"""
+        await ctx.send(embed=sales_report_embed(max(1, days)))
+
+    @bot.command(name="stats")
+    @commands.has_permissions(administrator=True)
+    async def show_stats(ctx):
+        """Задержки обработчиков, запросов к Discord и записи на диск"""
+        await ctx.send(embed=stats_embed())
+
     @bot.command(name="itemids")
     @commands.has_permissions(administrator=True)
     async def show_item_ids(ctx):
         await ctx.message.delete()
         
-        if not shop_items:
+        if not catalog:
             await ctx.send("❗ В магазине нет товаров.", delete_after=5)
             return
 
-        item_list = "\n".join([
-            f"🔹 {item['name']} — ID: {item['id']}, Канал: {item.get('channel_id', 'Основной')}"
-            for item in shop_items
-        ])
-        
-        embed = discord.Embed(title="📜 Список товаров", description=item_list, color=discord.Color.blue())
-        
-        message = await ctx.send(embed=embed)
-        await asyncio.sleep(30)
+        # Сообщение удаляется, когда список перестают листать
+        view = ItemListView()
+        message = await ctx.send(embed=view.embed, view=view)
+        await view.wait()
         await message.delete()
 
 
@@ -374,15 +697,17 @@ async def setup_admin_commands(bot):
     @commands.has_permissions(administrator=True)
     async def update_shop_command(ctx):
         await ctx.message.delete()
-        await update_shop(bot)
-        await ctx.send("✅ Магазин обновлен!", delete_after=5)
+        if await request_shop_update(bot):
+            await ctx.send("✅ Магазин обновлен!", delete_after=5)
+        else:
+            await ctx.send("❗ Магазин не обновлён: канал магазина не найден.", delete_after=5)
 
     # Команда обновления админ-панели
     @bot.command(name="updateadmin")
     @commands.has_permissions(administrator=True)
     async def update_admin_command(ctx):
         await ctx.message.delete()
-        await update_admin_panel(bot)
+        await update_admin_panel(bot, force=True)
         await ctx.send("✅ Админ-панель обновлена!", delete_after=5)
 
     # Команда очистки канала
@@ -454,9 +779,9 @@ async def setup_admin_commands(bot):
         await ctx.message.delete()
         
         # Данные оплаты
-        card_number = os.getenv("CARD_NUMBER")
-        card_holder = os.getenv("CARD_HOLDER")
-        bank = os.getenv("BANK_NAME")
+        card_number = config.card_number
+        card_holder = config.card_holder
+        bank = config.bank_name
         
         # Создаем эмбед с данными оплаты
         embed = discord.Embed(
@@ -488,4 +813,16 @@ async def setup_admin_commands(bot):
             await ctx.send("❌ У вас нет прав на эту команду!", delete_after=5)
 
 
-    print("✅ Модуль админ-команд загружен")        
+    print("✅ Модуль админ-команд загружен")
+
+async def teardown_admin_commands(bot):
+    """Выгрузка модуля; команды и слушатели снимает discord.py"""
+    drain_views(bot, __name__)
+    hand_off_state(bot, __name__, {})
+
+# Точки входа расширения discord.py
+async def setup(bot):
+    await setup_admin_commands(bot)
+
+async def teardown(bot):
+    await teardown_admin_commands(bot)
@@ -0,0 +1,173 @@
+import uuid
+
+# Лимит Discord на значение поля эмбеда
+EMBED_FIELD_LIMIT = 1024
+
+class Cart:
+    """Корзина пользователя: ID товара -> количество
+
+    Сумма и число единиц товара поддерживаются при каждом изменении,
+    поэтому добавление, удаление, просмотр и оформление не требуют
+    пересчёта всей корзины. version увеличивается при каждом изменении.
+    checkout_token - ключ оформления текущего содержимого: он уникален и
+    меняется при каждом оформлении (take).
+    """
+
+    def __init__(self):
+        self.lines = {}
+        self.total = 0
+        self.count = 0
+        self.revision = None
+        self.version = 0
+        self.checkout_token = uuid.uuid4().hex
+        self._description = None
+
+    @classmethod
+    def from_lines(cls, lines):
+        """Сборка корзины из сохранённых строк (старые строки - по одной единице)"""
+        cart = cls()
+        for line in lines:
+            cart.add(line.get("item_id"), line["name"], line["price"], line.get("quantity", 1))
+        return cart
+
+    def to_lines(self):
+        """Строки корзины для сохранения"""
+        return [
+            {"item_id": item_id, "name": line["name"], "price": line["price"], "quantity": line["quantity"]}
+            for item_id, line in self.lines.items()
+        ]
+
+    def __bool__(self):
+        return self.count > 0
+
+    def __len__(self):
+        return self.count
+
+    def quantity(self, item_id):
+        line = self.lines.get(item_id)
+        return line["quantity"] if line else 0
+
+    def add(self, item_id, name, price, quantity=1):
+        """Добавление единиц товара"""
+        line = self.lines.get(item_id)
+        if line is None:
+            line = self.lines[item_id] = {"name": name, "price": price, "quantity": 0}
+        elif line["price"] != price:
+            # Цена изменилась - все единицы считаются по новой цене
+            self.total += (price - line["price"]) * line["quantity"]
+            line["price"] = price
+        line["name"] = name
+        line["quantity"] += quantity
+        self.total += price * quantity
+        self.count += quantity
+        self.version += 1
+        self._description = None
+
+    def remove(self, item_id):
+        """Удаление одной единицы товара; возвращает строку или None, если товара нет"""
+        line = self.lines.get(item_id)
+        if line is None:
+            return None
+        line["quantity"] -= 1
+        self.total -= line["price"]
+        self.count -= 1
+        if line["quantity"] == 0:
+            del self.lines[item_id]
+        self.version += 1
+        self._description = None
+        return line
+
+    def clear(self):
+        self.lines.clear()
+        self.total = 0
+        self.count = 0
+        self.version += 1
+        self._description = None
+
+    def take(self):
+        """Перенос содержимого в новую корзину с очисткой текущей
+
+        Используется при оформлении заказа: снимок берётся и корзина очищается
+        без ожиданий, поэтому товары, добавленные во время создания тикета,
+        попадают уже в новую корзину.
+        """
+        snapshot = Cart()
+        snapshot.lines = self.lines
+        snapshot.total = self.total
+        snapshot.count = self.count
+        snapshot.revision = self.revision
+        snapshot._description = self._description
+        self.lines = {}
+        self.clear()
+        self.checkout_token = uuid.uuid4().hex
+        return snapshot
+
+    def merge(self, other):
+        """Возврат товаров другой корзины (например, при ошибке оформления)"""
+        for item_id, line in other.lines.items():
+            self.add(item_id, line["name"], line["price"], line["quantity"])
+
+    def reprice(self, resolve, item_ids=None, revision=None):
+        """Обновление цен по каталогу
+
+        resolve(item_id) возвращает (название, цена) или None, если товар удалён.
+        item_ids ограничивает проверку изменившимися товарами; ревизия
+        запоминается только после полной проверки. Возвращает True, если
+        корзина изменилась.
+        """
+        if item_ids is None:
+            candidates = list(self.lines)
+        else:
+            candidates = [item_id for item_id in item_ids if item_id in self.lines]
+
+        changed = False
+        for item_id in candidates:
+            line = self.lines[item_id]
+            resolved = resolve(item_id)
+            if resolved is None:
+                # Товар удалён из каталога
+                self.total -= line["price"] * line["quantity"]
+                self.count -= line["quantity"]
+                del self.lines[item_id]
+                changed = True
+                continue
+            name, price = resolved
+            if line["price"] != price or line["name"] != name:
+                self.total += (price - line["price"]) * line["quantity"]
+                line["price"] = price
+                line["name"] = name
+                changed = True
+
+        if changed:
+            self.version += 1
+            self._description = None
+        if revision is not None and item_ids is None:
+            self.revision = revision
+        return changed
+
+    def describe(self):
+        """Описание корзины по строке на товар с количеством"""
+        if self._description is None:
+            self._description = "\n".join(
+                f"- {line['name']} ×{line['quantity']}: {line['price'] * line['quantity']}р"
+                if line["quantity"] > 1 else f"- {line['name']}: {line['price']}р"
+                for line in self.lines.values()
+            )
+        return self._description
+
+    def describe_short(self, limit=EMBED_FIELD_LIMIT):
+        """Описание корзины, укороченное до limit символов"""
+        description = self.describe()
+        if len(description) <= limit:
+            return description
+        shown = []
+        length = 0
+        lines = description.split("\n")
+        for index, line in enumerate(lines):
+            suffix = f"\n… и ещё позиций: {len(lines) - index}"
+            if length + len(line) + 1 + len(suffix) > limit:
+                shown.append(suffix.strip())
+                break
+            shown.append(line)
+            length += len(line) + 1
+        return "\n".join(shown)
@@ -0,0 +1,184 @@
+import bisect
+
+from modules.storage import get_storage
+
+class Catalog:
+    """Каталог товаров с индексами по ID, названию и каналу
+
+    ID товаров выдаются возрастающим счётчиком и не переиспользуются.
+    Подписчики (subscribe) получают уведомление (event, item) о каждом
+    изменении, где event - "add", "update" или "remove". Версия товара
+    (version) растёт при каждом изменении и служит ключом для кешей,
+    ревизия каталога (revision) - при любом изменении любого товара.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.by_id = {}
+        self.by_name = {}
+        self.by_channel = {}
+        self.name_index = []
+        self.versions = {}
+        self.revision = 0
+        self.next_id = 1
+        self.listeners = {}
+        self.load()
+
+    def load(self):
+        """Загрузка товаров из хранилища"""
+        items = self.storage.load_items()
+
+        # Дополнение старых записей значениями по умолчанию
+        normalized = False
+        used_ids = {item["id"] for item in items if "id" in item}
+        next_free = max(used_ids, default=0) + 1
+        for item in items:
+            if "id" not in item:
+                item["id"] = next_free
+                next_free += 1
+                normalized = True
+            if "discount" not in item:
+                item["discount"] = 0
+                normalized = True
+            if "channel_id" not in item:
+                item["channel_id"] = None
+                normalized = True
+        if normalized:
+            self.storage.replace_items(items)
+
+        self.by_id = {}
+        self.by_name = {}
+        self.by_channel = {}
+        self.name_index = []
+        for item in items:
+            self.by_id[item["id"]] = item
+            self._index(item)
+
+        stored_next_id = self.storage.get_meta("next_item_id", 1)
+        self.next_id = max(stored_next_id, max(self.by_id, default=0) + 1)
+
+    def _index(self, item):
+        # Индексы по названию и каналу; порядок товаров задаёт by_id
+        self.by_name[item["name"]] = item
+        self.by_channel.setdefault(item.get("channel_id"), {})[item["id"]] = item
+        bisect.insort(self.name_index, (item["name"].lower(), item["id"]))
+
+    def _unindex(self, item):
+        if self.by_name.get(item["name"]) is item:
+            del self.by_name[item["name"]]
+        channel_items = self.by_channel.get(item.get("channel_id"))
+        if channel_items is not None:
+            channel_items.pop(item["id"], None)
+            if not channel_items:
+                del self.by_channel[item.get("channel_id")]
+        key = (item["name"].lower(), item["id"])
+        position = bisect.bisect_left(self.name_index, key)
+        if position < len(self.name_index) and self.name_index[position] == key:
+            del self.name_index[position]
+
+    def _notify(self, event, item):
+        self.revision += 1
+        for listener in list(self.listeners.values()):
+            try:
+                listener(event, item)
+            except Exception as e:
+                print(f"Ошибка в обработчике изменений каталога: {e}")
+
+    def __iter__(self):
+        return iter(list(self.by_id.values()))
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __bool__(self):
+        return bool(self.by_id)
+
+    def get(self, item_id):
+        """Товар по ID"""
+        try:
+            return self.by_id.get(int(item_id))
+        except (TypeError, ValueError):
+            return None
+
+    def version(self, item_id):
+        """Текущая версия товара"""
+        return self.versions.get(item_id, 0)
+
+    def price(self, item_id):
+        """Название и итоговая цена товара с учётом скидки или None, если товара нет"""
+        item = self.get(item_id)
+        if not item:
+            return None
+        return item["name"], item["price"] - item.get("discount", 0)
+
+    def find_by_name(self, name):
+        """Товар по точному названию"""
+        return self.by_name.get(name)
+
+    def search(self, prefix, limit=25):
+        """Товары, название которых начинается с prefix (без учёта регистра)"""
+        prefix = prefix.lower()
+        position = bisect.bisect_left(self.name_index, (prefix,))
+        result = []
+        for name, item_id in self.name_index[position:]:
+            if not name.startswith(prefix) or len(result) >= limit:
+                break
+            result.append(self.by_id[item_id])
+        return result
+
+    def in_channel(self, channel_id):
+        """Товары, привязанные к каналу (None - основной канал)"""
+        return list(self.by_channel.get(channel_id, {}).values())
+
+    def subscribe(self, name, listener):
+        """Подписка на изменения каталога; повторная подписка с тем же именем заменяет старую"""
+        self.listeners[name] = listener
+
+    def unsubscribe(self, name):
+        """Отписка от изменений каталога"""
+        self.listeners.pop(name, None)
+
+    def add(self, **fields):
+        """Добавление товара с новым ID"""
+        item = {"id": self.next_id, "discount": 0, "channel_id": None, **fields}
+        self.next_id += 1
+        self.storage.set_meta("next_item_id", self.next_id)
+        self.by_id[item["id"]] = item
+        self._index(item)
+        self.storage.save_item(item)
+        self._notify("add", item)
+        return item
+
+    def update(self, item_id, **fields):
+        """Изменение полей товара"""
+        item = self.get(item_id)
+        if not item:
+            return None
+        self._unindex(item)
+        item.update(fields)
+        self._index(item)
+        self.versions[item["id"]] = self.versions.get(item["id"], 0) + 1
+        self.storage.save_item(item)
+        self._notify("update", item)
+        return item
+
+    def remove(self, item_id):
+        """Удаление товара"""
+        item = self.get(item_id)
+        if not item:
+            return None
+        self._unindex(item)
+        del self.by_id[item["id"]]
+        self.versions.pop(item["id"], None)
+        self.storage.delete_item(item["id"])
+        self._notify("remove", item)
+        return item
+
+_catalog = None
+
+def get_catalog():
+    """Общий для всего процесса каталог товаров"""
+    global _catalog
+    if _catalog is None:
+        _catalog = Catalog(get_storage())
+    return _catalog
@@ -0,0 +1,156 @@
+import asyncio
+import datetime
+import time
+
+import discord
+
+from modules.metrics import metrics
+
+# Приоритеты очереди: чем меньше число, тем раньше выполняется запрос
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Ограничения параллельности
+WORKER_COUNT = 6
+ROUTE_CONCURRENCY = 2
+# Предел массовой полосы: при заполнении отправители ждут места в очереди
+BULK_QUEUE_LIMIT = 500
+BULK_DELETE_LIMIT = 100
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14)
+
+class RestDispatcher:
+    """Очередь REST-запросов к Discord с приоритетами и лимитами по маршрутам
+
+    Запросы идут по двум полосам. Один обработчик зарезервирован только под
+    интерактивную полосу, остальные сначала берут интерактивные запросы и лишь
+    затем массовые (публикация магазина, очистка каналов, архивация), поэтому
+    ответы пользователям не стоят в очереди за массовыми операциями.
+    Массовая полоса ограничена BULK_QUEUE_LIMIT запросами, поэтому большая
+    массовая операция не накапливает в памяти весь объём работы сразу.
+    """
+
+    def __init__(self, workers=WORKER_COUNT, route_concurrency=ROUTE_CONCURRENCY):
+        self.workers = workers
+        self.route_concurrency = route_concurrency
+        self.interactive = None
+        self.bulk = None
+        self.routes = {}
+        self._tasks = []
+
+    def _ensure_started(self):
+        if self._tasks and not all(task.done() for task in self._tasks):
+            return
+        self.interactive = asyncio.Queue()
+        self.bulk = asyncio.Queue(maxsize=BULK_QUEUE_LIMIT)
+        self.routes = {}
+        self._tasks = [asyncio.create_task(self._interactive_worker())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(max(1, self.workers - 1))]
+
+    def _route_lock(self, route):
+        if route not in self.routes:
+            # Отправка в канал выполняется строго по очереди, чтобы сохранить порядок сообщений
+            limit = 1 if route and route[0] == "send" else self.route_concurrency
+            self.routes[route] = asyncio.Semaphore(limit)
+        return self.routes[route]
+
+    async def _interactive_worker(self):
+        while True:
+            job = await self.interactive.get()
+            await self._run(*job)
+
+    async def _worker(self):
+        while True:
+            if not self.interactive.empty():
+                job = self.interactive.get_nowait()
+            else:
+                job = await self.bulk.get()
+            await self._run(*job)
+
+    async def _run(self, factory, route, future, queued_at):
+        if future.cancelled():
+            return
+        kind = route[0] if route else "other"
+        async with self._route_lock(route):
+            # Время ожидания в очереди и время самого запроса считаются отдельно
+            metrics.observe(f"rest_wait.{kind}", time.perf_counter() - queued_at)
+            try:
+                with metrics.span(f"rest.{kind}"):
+                    result = await factory()
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+
+    async def submit(self, factory, route=None, priority=PRIORITY_BULK):
+        """Постановка запроса в очередь и ожидание результата
+
+        factory - функция без аргументов, возвращающая корутину запроса.
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        job = (factory, route, future, time.perf_counter())
+        if priority < PRIORITY_BULK:
+            self.interactive.put_nowait(job)
+        else:
+            await self.bulk.put(job)
+        return await future
+
+    async def send(self, channel, priority=PRIORITY_BULK, **kwargs):
+        """Отправка сообщения в канал через очередь"""
+        return await self.submit(lambda: channel.send(**kwargs), ("send", channel.id), priority)
+
+    async def edit_message(self, channel, message_id, priority=PRIORITY_BULK, **kwargs):
+        """Редактирование сообщения по ID через очередь"""
+        message = channel.get_partial_message(message_id)
+        return await self.submit(lambda: message.edit(**kwargs), ("edit", channel.id), priority)
+
+    async def delete_message(self, channel, message_id, priority=PRIORITY_BULK):
+        """Удаление сообщения по ID через очередь"""
+        message = channel.get_partial_message(message_id)
+        try:
+            await self.submit(message.delete, ("delete", channel.id), priority)
+        except discord.NotFound:
+            pass
+
+    async def bulk_delete(self, channel, message_ids, priority=PRIORITY_BULK):
+        """Удаление сообщений пачками
+
+        Сообщения моложе 14 дней удаляются одним запросом на 100 сообщений,
+        более старые - по одному, так как Discord не принимает их в bulk-delete.
+        """
+        cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        recent = []
+        old = []
+        for message_id in message_ids:
+            if discord.utils.snowflake_time(message_id) > cutoff:
+                recent.append(message_id)
+            else:
+                old.append(message_id)
+
+        jobs = []
+        for start in range(0, len(recent), BULK_DELETE_LIMIT):
+            chunk = [discord.Object(id=message_id) for message_id in recent[start:start + BULK_DELETE_LIMIT]]
+            jobs.append(self.submit(
+                lambda chunk=chunk: channel.delete_messages(chunk),
+                ("delete", channel.id),
+                priority
+            ))
+        for message_id in old:
+            jobs.append(self.delete_message(channel, message_id, priority))
+
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, discord.NotFound):
+                print(f"Ошибка при удалении сообщений: {result}")
+        return len(message_ids)
+
+_dispatcher = None
+
+def get_dispatcher():
+    """Общая для всего процесса очередь REST-запросов"""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = RestDispatcher()
+    return _dispatcher
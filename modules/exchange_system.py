@@ -1,27 +1,36 @@
 import discord
 from discord.ext import commands
 import asyncio
-import json
-import os
+import time
 from datetime import datetime
 
-# Файл хранения данных о сделках
-EXCHANGES_FILE = "data/exchanges/exchanges.json"
+from modules.ticket_registry import get_exchange_registry
+from modules.dispatcher import get_dispatcher, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from modules.ticket_pool import get_ticket_pool
+from modules.guild_config import get_config, get_guild_cache
+from modules.metrics import metrics, timed
+from modules.lifecycle import add_persistent_view, drain_views
 
-# Проверка, что директория существует
-os.makedirs(os.path.dirname(EXCHANGES_FILE), exist_ok=True)
+# Реестр открытых тикетов привязывается при настройке модуля и
+# загружается один раз за время работы процесса
+registry = None
 
-# Загрузка данных о сделках
-def load_exchanges():
-    if os.path.exists(EXCHANGES_FILE):
-        with open(EXCHANGES_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {"exchanges": [], "active_tickets": {}}
+def bind_services():
+    """Получение общих объектов процесса"""
+    global registry
+    registry = get_exchange_registry()
 
-# Сохранение данных о сделках
-def save_exchanges(data):
-    with open(EXCHANGES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+# Задержка перед архивацией закрытого тикета, секунд
+CLOSE_ARCHIVE_DELAY = 10
+
+# Проверка неактивных тикетов: период, размер пачки и пауза между пачками, секунд
+SWEEP_INTERVAL = 600
+SWEEP_BATCH_SIZE = 5
+SWEEP_BATCH_PAUSE = 5
+
+# Настройки и объекты сервера, найденные при запуске
+config = get_config()
+guild_cache = get_guild_cache()
 
 # Класс создания выпадающего меню выбора пользователя
 class UserSelect(discord.ui.UserSelect):
@@ -33,6 +42,7 @@ class UserSelect(discord.ui.UserSelect):
             max_values=1,
         )
 
+    @timed("interaction.UserSelect.callback")
     async def callback(self, interaction: discord.Interaction):
         # Проверка, что выбор сделал автор запроса
         if interaction.user.id != self.author_id:
@@ -60,6 +70,7 @@ class ExchangeButton(discord.ui.View):
         super().__init__(timeout=None)  # Кнопка будет активна всегда
     
     @discord.ui.button(label="Создать сделку", style=discord.ButtonStyle.primary, custom_id="create_exchange", emoji="🔄")
+    @timed("interaction.ExchangeButton.create_exchange")
     async def create_exchange(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Создание выпадающее меню выбора пользователя
         view = discord.ui.View(timeout=60)
@@ -72,13 +83,21 @@ class ExchangeButton(discord.ui.View):
         )
 
 # Функция создания тикета сделки
+@timed("ticket.create_exchange")
 async def create_exchange_ticket(interaction, partner):
-    guild = interaction.guild
     author = interaction.user
     
-    # Получение ID категории тикетов из .env
-    ticket_category_id = int(os.getenv("TICKET_CATEGORY_ID"))
-    category = guild.get_channel(ticket_category_id)
+    # Проверка, нет ли уже открытой сделки между этими пользователями
+    existing_id = registry.find_between(author.id, partner.id)
+    if existing_id:
+        await interaction.response.send_message(
+            f"❗ У вас уже есть открытая сделка с этим пользователем: <#{existing_id}>",
+            ephemeral=True
+        )
+        return
+    
+    # Категория тикетов из кеша сервера
+    category = guild_cache.ticket_category
     
     if not category:
         await interaction.response.send_message("Ошибка: категория для тикетов не найдена.", ephemeral=True)
@@ -87,40 +106,24 @@ async def create_exchange_ticket(interaction, partner):
     # Создание имени канала тикета
     ticket_name = f"сделка-{author.name}-{partner.name}"
     
-    # Создание канала тикета
-    overwrites = {
-        guild.default_role: discord.PermissionOverwrite(read_messages=False),
-        author: discord.PermissionOverwrite(read_messages=True, send_messages=True),
-        partner: discord.PermissionOverwrite(read_messages=True, send_messages=True),
-        guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_channels=True)
-    }
-    
-    # Добавление прав у администраторов
-    for role in guild.roles:
-        if role.permissions.administrator:
-            overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
-    
-    # Создание канала тикета
-    ticket_channel = await guild.create_text_channel(
-        name=ticket_name,
-        category=category,
-        overwrites=overwrites,
+    # Права бота и администраторов из кеша, без перебора ролей сервера
+    overwrites = guild_cache.staff_overwrites()
+    overwrites[author] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+    overwrites[partner] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+    
+    # Канал берётся из запаса: нужны только переименование и права участников
+    ticket_channel = await get_ticket_pool().acquire(
+        category,
+        ticket_name,
+        overwrites,
         topic=f"Сделка между {author.name} и {partner.name}"
     )
     
     # Сохранение информации о тикете
-    exchanges = load_exchanges()
-    exchanges["active_tickets"][str(ticket_channel.id)] = {
-        "author_id": author.id,
-        "partner_id": partner.id,
-        "created_at": datetime.now().isoformat(),
-        "status": "open"
-    }
-    save_exchanges(exchanges)
-    
-    # Получение ID роли администратора из .env
-    admin_role_id = os.getenv("ADMIN_ROLE_ID", "0")
-    admin_mention = f"<@&{admin_role_id}>" if admin_role_id != "0" else ""
+    registry.open(ticket_channel.id, author.id, partner.id)
+    
+    # Упоминание роли администратора из настроек
+    admin_mention = f"<@&{config.admin_role_id}>" if config.admin_role_id else ""
     
     # Отправление сообщения в канал тикета
     embed = discord.Embed(
@@ -165,7 +168,9 @@ async def create_exchange_ticket(interaction, partner):
     )
     view.add_item(close_button)
     
-    await ticket_channel.send(
+    await get_dispatcher().send(
+        ticket_channel,
+        PRIORITY_INTERACTIVE,
         content=f"{author.mention} {partner.mention} {admin_mention}",
         embed=embed,
         view=view
@@ -234,6 +239,7 @@ async def create_exchange_post(ctx, channel_id, title, description, image_url=No
     await ctx.send(f"✅ Сообщение с кнопкой сделки создано в форуме: {thread.mention}")
 
 # Функция закрытия тикета сделки
+@timed("ticket.close_exchange")
 async def close_exchange_ticket(interaction, ticket_id):
     channel = interaction.guild.get_channel(int(ticket_id))
     
@@ -242,8 +248,7 @@ async def close_exchange_ticket(interaction, ticket_id):
         return
     
     # Проверка, является ли пользователь участником сделки или администратором
-    exchanges = load_exchanges()
-    ticket_info = exchanges["active_tickets"].get(str(ticket_id))
+    ticket_info = registry.get(ticket_id)
     
     if not ticket_info:
         await interaction.response.send_message("❌ Информация о тикете не найдена.", ephemeral=True)
@@ -257,13 +262,26 @@ async def close_exchange_ticket(interaction, ticket_id):
         await interaction.response.send_message("❌ У вас нет прав на закрытие этого тикета.", ephemeral=True)
         return
     
+    # Перенос тикета в архив до любых запросов к Discord, чтобы повторное закрытие было невозможно
+    registry.close(ticket_id, interaction.user.id)
+    
     # Отправление сообщения о закрытии
     await interaction.response.send_message("🔒 Закрытие тикета сделки...")
     
+    await archive_exchange_channel(
+        channel,
+        ticket_info,
+        f"Тикет был закрыт пользователем {interaction.user.mention}",
+        CLOSE_ARCHIVE_DELAY,
+        PRIORITY_INTERACTIVE
+    )
+
+async def archive_exchange_channel(channel, ticket_info, description, delay, priority):
+    """Сообщение о закрытии и перенос канала закрытого тикета в архив"""
     # Создание эмбеда с информацией о закрытии
     embed = discord.Embed(
         title="🔒 Тикет сделки закрыт",
-        description=f"Тикет был закрыт пользователем {interaction.user.mention}",
+        description=description,
         color=discord.Color.red()
     )
     
@@ -285,16 +303,11 @@ async def close_exchange_ticket(interaction, ticket_id):
         inline=True
     )
     
-    await channel.send(embed=embed)
+    await get_dispatcher().send(channel, priority, embed=embed)
     
-    # Обновление статуса тикета
-    ticket_info["status"] = "closed"
-    ticket_info["closed_at"] = datetime.now().isoformat()
-    ticket_info["closed_by"] = interaction.user.id
-    save_exchanges(exchanges)
-    
-    # Архивация канала через 10 секунд
-    await asyncio.sleep(10)
+    # Архивация канала через delay секунд
+    if delay:
+        await asyncio.sleep(delay)
     
     try:
         # Изменение прав доступа, чтобы никто не мог писать
@@ -303,24 +316,95 @@ async def close_exchange_ticket(interaction, ticket_id):
             overwrite.send_messages = False
             overwrites[target] = overwrite
         
-        await channel.edit(overwrites=overwrites)
-        
         # Добавление префикса к названию канала
-        new_name = f"закрыт-{channel.name}"
-        await channel.edit(name=new_name)
+        changes = {"overwrites": overwrites, "name": f"закрыт-{channel.name}"}
         
         # Перемещение в архивную категорию, если она есть
-        archive_category_id = os.getenv("ARCHIVE_CATEGORY_ID")
-        if archive_category_id:
-            archive_category = interaction.guild.get_channel(int(archive_category_id))
-            if archive_category:
-                await channel.edit(category=archive_category)
+        if guild_cache.archive_category:
+            changes["category"] = guild_cache.archive_category
+        
+        # Все изменения применяются одним запросом в массовой полосе очереди
+        await get_dispatcher().submit(lambda: channel.edit(**changes), ("channel", channel.id))
     
     except Exception as e:
         print(f"Ошибка при архивации канала: {e}")
 
+def seed_activity(bot):
+    """Уточнение активности тикетов по последнему сообщению в кеше каналов"""
+    for channel_id in list(registry.by_channel):
+        channel = bot.get_channel(int(channel_id))
+        if channel and getattr(channel, "last_message_id", None):
+            registry.touch(channel_id, discord.utils.snowflake_time(channel.last_message_id).timestamp())
+
+async def track_exchange_activity(message):
+    """Отметка активности в тикете сделки по сообщению участника"""
+    if message.guild and not message.author.bot and registry.get(message.channel.id):
+        registry.touch(message.channel.id, message.created_at.timestamp())
+
+@timed("ticket.expire_exchange")
+async def expire_exchange_ticket(bot, channel_id, hours):
+    """Закрытие неактивного тикета тем же путём, что и командой"""
+    ticket_info = registry.close(channel_id, bot.user.id, reason="inactive")
+    channel = bot.get_channel(int(channel_id))
+    # Канал, удалённый вручную, только убирается из реестра
+    if not ticket_info or not channel:
+        return
+    await archive_exchange_channel(
+        channel,
+        ticket_info,
+        f"Тикет закрыт автоматически: в нём не было сообщений больше {hours:g} ч",
+        0,
+        PRIORITY_BULK
+    )
+
+async def sweep_inactive_tickets(bot):
+    """Закрытие тикетов без активности дольше EXCHANGE_TICKET_TTL_HOURS
+
+    Тикеты закрываются пачками по SWEEP_BATCH_SIZE с паузой между пачками,
+    запросы идут через массовую полосу очереди и не задерживают действия
+    пользователей.
+    """
+    ttl = config.exchange_ticket_ttl
+    if ttl <= 0:
+        return 0
+    expired = registry.inactive(ttl, time.time())
+    for start in range(0, len(expired), SWEEP_BATCH_SIZE):
+        if start:
+            await asyncio.sleep(SWEEP_BATCH_PAUSE)
+        batch = expired[start:start + SWEEP_BATCH_SIZE]
+        results = await asyncio.gather(
+            *(expire_exchange_ticket(bot, channel_id, ttl / 3600) for channel_id in batch),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Ошибка при закрытии неактивного тикета: {result}")
+    if expired:
+        print(f"✅ Закрыто неактивных тикетов сделок: {len(expired)}")
+    return len(expired)
+
+async def run_sweeper(bot):
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            await sweep_inactive_tickets(bot)
+        except Exception as e:
+            print(f"Ошибка при проверке неактивных тикетов: {e}")
+
+# Фоновая проверка неактивных тикетов
+sweeper_task = None
+
 # Функция настройки модуля
 async def setup_exchange_system(bot):
+    bind_services()
+
+    global sweeper_task
+
+    # Активность тикетов: последнее сообщение в кеше и новые сообщения
+    seed_activity(bot)
+    bot.add_listener(track_exchange_activity, "on_message")
+    sweeper_task = asyncio.create_task(run_sweeper(bot))
+
     # Команда создания сообщения с кнопкой сделки
     @bot.command(name="createexchange")
     @commands.has_permissions(administrator=True)
@@ -351,13 +435,12 @@ async def setup_exchange_system(bot):
     async def close_exchange_command(ctx):
         """Закрывает текущий тикет сделки"""
         # Проверка, что команда вызвана в канале тикета
-        exchanges = load_exchanges()
-        if str(ctx.channel.id) not in exchanges["active_tickets"]:
+        ticket_info = registry.get(ctx.channel.id)
+        if not ticket_info:
             await ctx.send("❌ Эта команда может быть использована только в канале тикета сделки.")
             return
         
         # Проверка прав пользователя
-        ticket_info = exchanges["active_tickets"][str(ctx.channel.id)]
         is_admin = ctx.author.guild_permissions.administrator
         is_participant = (ctx.author.id == ticket_info["author_id"] or 
                           ctx.author.id == ticket_info["partner_id"])
@@ -385,13 +468,14 @@ async def setup_exchange_system(bot):
         if interaction.type == discord.InteractionType.component:
             custom_id = interaction.data.get("custom_id", "")
             
-            # Обработка кнопки закрытия тикета
+            # Обработка кнопки закрытия тикета; замеряются только эти нажатия
             if custom_id.startswith("close_exchange_"):
                 ticket_id = custom_id.split("_")[-1]
-                await close_exchange_ticket(interaction, ticket_id)
+                with metrics.span("interaction.exchange_button"):
+                    await close_exchange_ticket(interaction, ticket_id)
 
     # Регистрация постоянной кнопки
-    bot.add_view(ExchangeButton())
+    add_persistent_view(bot, __name__, ExchangeButton())
     
     # Добавление информации о модуле в команду !adminhelp
     if hasattr(bot, 'admin_help_info'):
@@ -406,3 +490,16 @@ async def setup_exchange_system(bot):
         })
     
     print("✅ Модуль системы сделок успешно загружен!")
+
+async def teardown_exchange_system(bot):
+    """Выгрузка модуля; команды и слушатели снимает discord.py"""
+    drain_views(bot, __name__)
+    if sweeper_task is not None:
+        sweeper_task.cancel()
+
+# Точки входа расширения discord.py
+async def setup(bot):
+    await setup_exchange_system(bot)
+
+async def teardown(bot):
+    await teardown_exchange_system(bot)
@@ -0,0 +1,147 @@
+import os
+
+import discord
+
+def env_id(name):
+    """ID из переменной окружения или None, если он не задан"""
+    value = os.getenv(name, "").strip()
+    return int(value) if value.isdigit() and int(value) else None
+
+class Config:
+    """Настройки из .env, разбираются один раз при запуске"""
+
+    def __init__(self):
+        self.guild_id = env_id("GUILD_ID")
+        self.shop_channel_id = env_id("SHOP_CHANNEL_ID")
+        self.cart_channel_id = env_id("CART_CHANNEL_ID")
+        self.admin_channel_id = env_id("ADMIN_CHANNEL_ID")
+        self.review_channel_id = env_id("REVIEW_CHANNEL_ID")
+        self.ticket_category_id = env_id("TICKET_CATEGORY_ID")
+        self.archive_category_id = env_id("ARCHIVE_CATEGORY_ID")
+        self.admin_role_id = env_id("ADMIN_ROLE_ID")
+        self.card_number = os.getenv("CARD_NUMBER")
+        self.card_holder = os.getenv("CARD_HOLDER")
+        self.bank_name = os.getenv("BANK_NAME")
+        self.ticket_pool_size = int(os.getenv("TICKET_POOL_SIZE", "3"))
+        # Тикеты сделок без сообщений дольше этого срока закрываются автоматически (0 - не закрывать)
+        self.exchange_ticket_ttl = float(os.getenv("EXCHANGE_TICKET_TTL_HOURS", "72") or 0) * 3600
+        # Шардирование в одном процессе
+        self.sharding = os.getenv("SHARDING", "off").strip().lower() == "auto"
+        shard_count = os.getenv("SHARD_COUNT", "").strip()
+        self.shard_count = int(shard_count) if shard_count.isdigit() else None
+
+# Роли, которые ищутся по названию
+ADMIN_ROLE_NAME = "Admin"
+MEMBER_ROLE_NAME = "Участник"
+
+class GuildCache:
+    """Сервер, категории и роли, найденные заранее
+
+    Объекты обновляются по событиям изменения ролей и каналов, поэтому при
+    создании тикетов не нужно перебирать роли и каналы сервера.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.bot = None
+        self.guild = None
+        self.ticket_category = None
+        self.archive_category = None
+        self.admin_role = None
+        self.member_role = None
+        self.administrator_roles = []
+
+    def attach(self, bot):
+        """Первичное заполнение и подписка на события сервера"""
+        if self.bot is not bot:
+            self.bot = bot
+            bot.add_listener(self.on_guild_available, "on_guild_available")
+            for event in ("on_guild_role_create", "on_guild_role_delete"):
+                bot.add_listener(self.on_role_change, event)
+            bot.add_listener(self.on_guild_role_update, "on_guild_role_update")
+            for event in ("on_guild_channel_create", "on_guild_channel_delete"):
+                bot.add_listener(self.on_channel_change, event)
+            bot.add_listener(self.on_guild_channel_update, "on_guild_channel_update")
+        self.refresh()
+
+    def refresh(self):
+        """Полное обновление кеша"""
+        self.guild = self.bot.get_guild(self.config.guild_id) if self.config.guild_id else None
+        self.refresh_channels()
+        self.refresh_roles()
+
+    def _category(self, category_id):
+        if not self.guild or not category_id:
+            return None
+        category = self.guild.get_channel(category_id)
+        return category if isinstance(category, discord.CategoryChannel) else None
+
+    def refresh_channels(self):
+        self.ticket_category = self._category(self.config.ticket_category_id)
+        self.archive_category = self._category(self.config.archive_category_id)
+
+    def refresh_roles(self):
+        self.admin_role = None
+        self.member_role = None
+        self.administrator_roles = []
+        if not self.guild:
+            return
+        for role in self.guild.roles:
+            if role.name == ADMIN_ROLE_NAME:
+                self.admin_role = role
+            elif role.name == MEMBER_ROLE_NAME:
+                self.member_role = role
+            if role.permissions.administrator:
+                self.administrator_roles.append(role)
+
+    def _ours(self, guild):
+        return guild.id == self.config.guild_id
+
+    async def on_guild_available(self, guild):
+        if self._ours(guild):
+            self.refresh()
+
+    async def on_role_change(self, role):
+        if self._ours(role.guild):
+            self.refresh_roles()
+
+    async def on_guild_role_update(self, before, after):
+        if self._ours(after.guild):
+            self.refresh_roles()
+
+    async def on_channel_change(self, channel):
+        if self._ours(channel.guild) and channel.id in (self.config.ticket_category_id, self.config.archive_category_id):
+            self.refresh_channels()
+
+    async def on_guild_channel_update(self, before, after):
+        if self._ours(after.guild) and after.id in (self.config.ticket_category_id, self.config.archive_category_id):
+            self.refresh_channels()
+
+    def staff_overwrites(self):
+        """Права бота и администраторов в каналах тикетов"""
+        overwrites = {
+            self.guild.default_role: discord.PermissionOverwrite(read_messages=False, send_messages=False),
+            self.guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_channels=True)
+        }
+        for role in self.administrator_roles:
+            overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+        if self.admin_role:
+            overwrites[self.admin_role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+        return overwrites
+
+_config = None
+_cache = None
+
+def get_config():
+    """Настройки процесса"""
+    global _config
+    if _config is None:
+        _config = Config()
+    return _config
+
+def get_guild_cache():
+    """Общий для всего процесса кеш объектов сервера"""
+    global _cache
+    if _cache is None:
+        _cache = GuildCache(get_config())
+    return _cache
@@ -0,0 +1,25 @@
+def add_persistent_view(bot, module_name, view, message_id=None):
+    """Регистрация постоянного представления, принадлежащего модулю"""
+    bot.add_view(view, message_id=message_id)
+    if not hasattr(bot, "module_views"):
+        bot.module_views = {}
+    bot.module_views.setdefault(module_name, []).append(view)
+
+def drain_views(bot, module_name):
+    """Отключение постоянных представлений модуля перед его выгрузкой
+
+    Обработчики, уже начавшие работу, завершаются, а новые нажатия после
+    загрузки новой версии модуля получают её представления.
+    """
+    for view in getattr(bot, "module_views", {}).pop(module_name, []):
+        view.stop()
+
+def hand_off_state(bot, module_name, state):
+    """Сохранение состояния выгружаемого модуля для его новой версии"""
+    if not hasattr(bot, "module_state"):
+        bot.module_state = {}
+    bot.module_state[module_name] = state
+
+def take_over_state(bot, module_name):
+    """Состояние, переданное предыдущей версией модуля, или None при первой загрузке"""
+    return getattr(bot, "module_state", {}).pop(module_name, None)
@@ -0,0 +1,263 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Границы корзин гистограмм задержки в секундах
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LOOP_LAG_INTERVAL = 0.5
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и оценкой перцентилей"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Оценка перцентиля линейной интерполяцией внутри корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                # Оценка не может превышать наблюдавшийся максимум
+                upper = min(upper, self.max)
+                lower = min(lower, upper)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.max
+
+class Metrics:
+    """Счётчики и гистограммы задержек всего процесса
+
+    Запись возможна из любого потока (в том числе из потока записи на диск).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, value):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    @contextmanager
+    def span(self, name):
+        """Замер времени выполнения блока; ошибки считаются отдельно"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.increment(f"{name}.errors")
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """Сводка: имя -> (количество, p50, p95, p99, максимум) в секундах"""
+        with self.lock:
+            return {
+                name: (h.count, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99), h.max)
+                for name, h in self.histograms.items()
+            }
+
+    def render_prometheus(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                kind, _, target = name.partition(".")
+                label = f'kind="{kind}",name="{target}"'
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'keepershop_latency_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'keepershop_latency_seconds_bucket{{{label},le="+Inf"}} {histogram.count}')
+                lines.append(f"keepershop_latency_seconds_sum{{{label}}} {histogram.sum:.6f}")
+                lines.append(f"keepershop_latency_seconds_count{{{label}}} {histogram.count}")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'keepershop_events_total{{name="{name}"}} {value}')
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f'keepershop_gauge{{name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class StartupReport:
+    """Длительность этапов запуска процесса
+
+    Этапы могут быть вложенными; после вывода отчёта (finish) новые этапы
+    не записываются, поэтому перезагрузка модулей отчёт не меняет.
+    """
+
+    def __init__(self):
+        self.phases = []
+        self.depth = 0
+        self.finished = False
+
+    @contextmanager
+    def phase(self, name):
+        if self.finished:
+            yield
+            return
+        entry = [name, self.depth, None]
+        self.phases.append(entry)
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            entry[2] = time.perf_counter() - start
+            metrics.set_gauge(f"startup.{name}_seconds", round(entry[2], 6))
+
+    def record(self, name, seconds):
+        """Этап, замеренный вне блока with"""
+        if not self.finished:
+            self.phases.append([name, self.depth, seconds])
+            metrics.set_gauge(f"startup.{name}_seconds", round(seconds, 6))
+
+    def finish(self, total):
+        """Текст отчёта; total - время от запуска процесса"""
+        self.finished = True
+        metrics.set_gauge("startup.total_seconds", round(total, 6))
+        lines = [f"⏱ Запуск за {total:.2f} с"]
+        if resource is not None:
+            # ru_maxrss в Linux - в килобайтах
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            metrics.set_gauge("startup.peak_rss_megabytes", round(peak, 1))
+            lines[0] += f", пик памяти {peak:.0f} МБ"
+        for name, depth, seconds in self.phases:
+            duration = f"{seconds * 1000:.0f} мс" if seconds is not None else "не завершён"
+            lines.append(f"{'  ' * (depth + 1)}{name}: {duration}")
+        return "\n".join(lines)
+
+startup = StartupReport()
+
+def startup_phase(name):
+    """Замер этапа запуска"""
+    return startup.phase(name)
+
+def timed(name):
+    """Декоратор замера времени корутины"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with metrics.span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_http_response(method, status, seconds):
+    """Замер одного HTTP-ответа Discord; каждый ответ 429 считается один раз"""
+    metrics.observe(f"http.{method}", seconds)
+    if status == 429:
+        metrics.increment("rest.rate_limited")
+
+def http_trace():
+    """Трассировка всех HTTP-запросов бота (параметр http_trace клиента)
+
+    Замеряются и запросы вне очереди: ответы на взаимодействия, followup и
+    вебхуки. Повтор после 429 - отдельный запрос со своим замером.
+    """
+    import aiohttp
+
+    async def on_request_start(session, context, params):
+        context.started_at = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        record_http_response(params.method, params.response.status, time.perf_counter() - context.started_at)
+
+    async def on_request_exception(session, context, params):
+        metrics.increment(f"http.{params.method}.errors")
+        metrics.observe(f"http.{params.method}", time.perf_counter() - context.started_at)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    trace.on_request_exception.append(on_request_exception)
+    return trace
+
+async def watch_loop_lag(interval=LOOP_LAG_INTERVAL):
+    """Измерение задержки цикла событий: насколько позже срабатывает sleep"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        metrics.observe("loop.lag", lag)
+        metrics.set_gauge("loop.lag_seconds", round(lag, 6))
+
+async def handle_metrics_request(reader, writer):
+    try:
+        await reader.readline()
+        body = metrics.render_prometheus().encode("utf-8")
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            + f"Content-Length: {len(body)}\r\n".encode("ascii")
+            + b"Connection: close\r\n\r\n"
+            + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+_started = False
+_lag_task = None
+
+async def start_metrics():
+    """Запуск замера задержки цикла и HTTP-эндпоинта метрик (METRICS_PORT)
+
+    Эндпоинт слушает только 127.0.0.1 и не запускается, если порт не задан.
+    """
+    global _started, _lag_task
+    if _started:
+        return
+    _started = True
+    _lag_task = asyncio.create_task(watch_loop_lag())
+    port = os.getenv("METRICS_PORT", "").strip()
+    if port.isdigit() and int(port):
+        try:
+            await asyncio.start_server(handle_metrics_request, "127.0.0.1", int(port))
+        except OSError as e:
+            # Занятый порт не мешает запуску бота, работа продолжается без эндпоинта
+            print(f"❌ Не удалось открыть эндпоинт метрик на порту {port}: {e}")
+            return
+        print(f"✅ Метрики доступны на http://127.0.0.1:{port}/metrics")
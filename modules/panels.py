@@ -0,0 +1,62 @@
+import hashlib
+import json
+
+import discord
+
+from modules.persistence import atomic_write_json, read_json_file
+from modules.dispatcher import get_dispatcher
+
+PANELS_FILE = "data/panels.json"
+
+# Опубликованные панели, файл читается один раз
+panels = None
+
+def load_panels():
+    global panels
+    if panels is None:
+        panels = read_json_file(PANELS_FILE, {})
+    return panels
+
+def panel_hash(embed, view):
+    """Хеш содержимого панели: эмбед и кнопки"""
+    payload = json.dumps([embed.to_dict(), view.to_components()], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+async def publish_panel(channel, key, embed, view, cleanup, force=False):
+    """Публикация панели с кнопками только при изменении её содержимого
+
+    Последняя опубликованная версия хранится в PANELS_FILE. Если хеш совпадает,
+    запросов к Discord нет; если изменился - сообщение редактируется. Новое
+    сообщение отправляется только когда старого нет или при force=True,
+    перед этим вызывается cleanup() для удаления старых сообщений.
+    Возвращает True, если в Discord что-то было изменено.
+    """
+    dispatcher = get_dispatcher()
+    panels = load_panels()
+    entry = panels.get(key)
+    digest = panel_hash(embed, view)
+
+    if entry and entry["channel_id"] != channel.id:
+        entry = None
+
+    if entry and not force:
+        if entry["hash"] == digest:
+            return False
+        try:
+            await dispatcher.edit_message(channel, entry["message_id"], embed=embed, view=view)
+            entry["hash"] = digest
+            atomic_write_json(PANELS_FILE, panels)
+            return True
+        except discord.NotFound:
+            # Сообщение удалено вручную - панель публикуется заново
+            pass
+
+    await cleanup()
+    message = await dispatcher.send(channel, embed=embed, view=view)
+    panels[key] = {
+        "channel_id": channel.id,
+        "message_id": message.id,
+        "hash": digest
+    }
+    atomic_write_json(PANELS_FILE, panels)
+    return True
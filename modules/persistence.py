@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.metrics import metrics
+
+# Быстрый кодировщик JSON, если установлен orjson
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Все записи на диск выполняются в одном отдельном потоке по порядку
+writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persistence")
+
+# Последние ещё не записанные данные для каждого файла
+pending_writes = {}
+pending_lock = threading.Lock()
+
+def dumps_json(data):
+    """Компактная сериализация JSON в байты"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def loads_json(content):
+    return orjson.loads(content) if orjson is not None else json.loads(content)
+
+def read_json_file(path, default):
+    """Чтение JSON-файла с возвратом значения по умолчанию"""
+    with pending_lock:
+        payload = pending_writes.get(path)
+    if payload is not None:
+        # Файл ещё ждёт записи - актуальны данные из очереди
+        return loads_json(payload)
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                content = f.read().strip()
+                if content:
+                    return loads_json(content)
+        except (ValueError, FileNotFoundError):
+            pass
+    return default
+
+def write_bytes_atomic(path, payload):
+    """Запись во временный файл с последующей атомарной заменой"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _write_pending(path):
+    with pending_lock:
+        payload = pending_writes.pop(path, None)
+    if payload is not None:
+        with metrics.span("disk.write_json"):
+            write_bytes_atomic(path, payload)
+
+def _report_error(future):
+    error = future.exception()
+    if error is not None:
+        print(f"Ошибка при записи данных на диск: {error}")
+
+def _wait_outside_loop(future):
+    # Вне цикла событий (завершение работы) дожидаемся записи сразу
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        future.result()
+
+def submit_write(func, *args):
+    """Выполнение функции записи в потоке записи после всех предыдущих"""
+    future = writer_executor.submit(func, *args)
+    future.add_done_callback(_report_error)
+    _wait_outside_loop(future)
+    return future
+
+def atomic_write_json(path, data):
+    """Атомарная запись JSON в потоке записи
+
+    Данные сериализуются сразу, а запись на диск выполняется в фоне. Если файл
+    ещё ждёт записи, в него попадут только последние данные.
+    """
+    payload = dumps_json(data)
+    with pending_lock:
+        scheduled = path in pending_writes
+        pending_writes[path] = payload
+    if scheduled:
+        return None
+    return submit_write(_write_pending, path)
+
+def _append_line(path, payload):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with metrics.span("disk.append"), open(path, "ab") as f:
+        f.write(payload + b"\n")
+
+def append_line(path, payload):
+    """Дописывание готовой строки байтов в конец файла в потоке записи"""
+    return submit_write(_append_line, path, payload)
+
+def append_json_line(path, data):
+    """Дописывание строки JSON в конец файла в потоке записи"""
+    return append_line(path, dumps_json(data))
+
+def flush_writes():
+    """Ожидание завершения всех запланированных записей"""
+    writer_executor.submit(lambda: None).result()
+
+class DebouncedWriter:
+    """Отложенная запись данных
+
+    Изменения помечаются через mark_dirty(), а функция write вызывается
+    в фоне не чаще одного раза за delay секунд. flush() записывает данные сразу.
+    """
+
+    def __init__(self, write, delay=2.0):
+        self.write = write
+        self.delay = delay
+        self.dirty = False
+        self._task = None
+
+    def mark_dirty(self):
+        """Пометка данных как изменённых и планирование записи"""
+        self.dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне цикла событий откладывать запись некуда
+            self.flush()
+            return
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        self._task = None
+        self.flush()
+
+    def flush(self):
+        """Немедленная запись изменённых данных"""
+        if self._task is not None and not self._task.done():
+            try:
+                current = asyncio.current_task()
+            except RuntimeError:
+                current = None
+            if self._task is not current:
+                self._task.cancel()
+            self._task = None
+        if not self.dirty:
+            return
+        self.dirty = False
+        try:
+            self.write()
+        except Exception as e:
+            self.dirty = True
+            print(f"Ошибка при отложенной записи данных: {e}")
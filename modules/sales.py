@@ -0,0 +1,121 @@
+import os
+from datetime import date, datetime, timedelta
+
+from modules.persistence import DebouncedWriter, append_line, atomic_write_json, dumps_json, loads_json, read_json_file
+
+ORDER_LOG_FILE = "data/orders/log.jsonl"
+SALES_STATS_FILE = "data/orders/stats.json"
+STATS_SAVE_DELAY = 5.0
+
+def empty_stats():
+    return {"log_size": 0, "orders": 0, "revenue": 0, "units": 0, "items": {}, "days": {}}
+
+class SalesStats:
+    """Журнал заказов и накопленная статистика продаж
+
+    Каждый заказ дописывается в конец журнала одной компактной строкой, а
+    сводки (выручка по товарам за день, лучшие товары, средний чек)
+    обновляются сразу при записи заказа. Для отчёта журнал не читается.
+    В статистике хранится размер уже учтённой части журнала, поэтому после
+    сбоя при запуске дочитывается только её хвост.
+    """
+
+    def __init__(self):
+        self.stats = read_json_file(SALES_STATS_FILE, None) or empty_stats()
+        self.writer = DebouncedWriter(self.save, delay=STATS_SAVE_DELAY)
+        self._replay_log()
+
+    def _replay_log(self):
+        if not os.path.exists(ORDER_LOG_FILE):
+            return
+        with open(ORDER_LOG_FILE, "rb") as f:
+            f.seek(self.stats["log_size"])
+            replayed = 0
+            for line in f:
+                # Недописанная строка в конце журнала пропускается
+                if not line.endswith(b"\n"):
+                    break
+                self._apply(loads_json(line))
+                self.stats["log_size"] += len(line)
+                replayed += 1
+        if replayed:
+            print(f"✅ Статистика продаж дополнена из журнала: заказов {replayed}")
+            self.save()
+
+    def _apply(self, record):
+        stats = self.stats
+        day = stats["days"].setdefault(record["d"], {"orders": 0, "revenue": 0, "items": {}})
+        stats["orders"] += 1
+        stats["revenue"] += record["s"]
+        day["orders"] += 1
+        day["revenue"] += record["s"]
+        for item_id, name, quantity, price in record["l"]:
+            key = str(item_id)
+            revenue = quantity * price
+            stats["units"] += quantity
+            item = stats["items"].setdefault(key, {"name": name, "quantity": 0, "revenue": 0})
+            item["name"] = name
+            item["quantity"] += quantity
+            item["revenue"] += revenue
+            day_item = day["items"].setdefault(key, [0, 0])
+            day_item[0] += quantity
+            day_item[1] += revenue
+
+    def record(self, channel_id, buyer_id, cart):
+        """Запись оформленного заказа в журнал и обновление сводок"""
+        now = datetime.now()
+        record = {
+            "t": int(now.timestamp()),
+            "d": now.strftime("%Y-%m-%d"),
+            "c": channel_id,
+            "u": buyer_id,
+            "s": cart.total,
+            "l": [[item_id, line["name"], line["quantity"], line["price"]] for item_id, line in cart.lines.items()]
+        }
+        payload = dumps_json(record)
+        append_line(ORDER_LOG_FILE, payload)
+        self._apply(record)
+        self.stats["log_size"] += len(payload) + 1
+        self.writer.mark_dirty()
+
+    def save(self):
+        atomic_write_json(SALES_STATS_FILE, self.stats)
+
+    def flush(self):
+        self.writer.flush()
+
+    def average_basket(self):
+        return self.stats["revenue"] // self.stats["orders"] if self.stats["orders"] else 0
+
+    def top_items(self, limit=10, days=None):
+        """Лучшие товары по выручке: за всё время или за последние days дней"""
+        if days is None:
+            totals = {key: (item["quantity"], item["revenue"]) for key, item in self.stats["items"].items()}
+        else:
+            totals = {}
+            for day in self.recent_days(days):
+                for key, (quantity, revenue) in self.stats["days"][day]["items"].items():
+                    total_quantity, total_revenue = totals.get(key, (0, 0))
+                    totals[key] = (total_quantity + quantity, total_revenue + revenue)
+        ranked = sorted(totals.items(), key=lambda entry: entry[1][1], reverse=True)[:limit]
+        return [
+            (self.stats["items"][key]["name"], quantity, revenue)
+            for key, (quantity, revenue) in ranked
+        ]
+
+    def recent_days(self, days):
+        """Даты с заказами за последние days календарных дней, от новых к старым"""
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        return sorted((key for key in self.stats["days"] if key >= since), reverse=True)
+
+    def day(self, date):
+        return self.stats["days"].get(date)
+
+_sales = None
+
+def get_sales():
+    """Общая для всего процесса статистика продаж"""
+    global _sales
+    if _sales is None:
+        _sales = SalesStats()
+    return _sales
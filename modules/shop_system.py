@@ -2,131 +2,223 @@ import discord
 from discord.ext import commands
 from discord.ui import Button, View, Modal, TextInput
 import json
-import os
 import asyncio
-
-SHOP_DATA_FILE = "data/shop_data.json"
-CART_DATA_FILE = "data/user_carts.json"
-
-# Загрузка данных магазина
-if os.path.exists(SHOP_DATA_FILE):
-    try:
-        with open(SHOP_DATA_FILE, "r") as f:
-            content = f.read().strip()
-            if content:
-                shop_items = json.loads(content)
-            else:
-                shop_items = []
-    except (json.JSONDecodeError, FileNotFoundError):
-        shop_items = []
-else:
-    shop_items = []
-
-# Инициализация товаров магазина
-for index, item in enumerate(shop_items, start=1):
-    if "id" not in item:
-        item["id"] = index
-    if "discount" not in item:
-        item["discount"] = 0
-    if "channel_id" not in item:
-        item["channel_id"] = None
-
-# Сохранение данных магазина
-os.makedirs("data", exist_ok=True)
-with open(SHOP_DATA_FILE, "w") as f:
-    json.dump(shop_items, f, ensure_ascii=False, indent=4)
-
-# Загрузка данных корзин
-if os.path.exists(CART_DATA_FILE):
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from modules.persistence import DebouncedWriter, atomic_write_json, read_json_file
+from modules.storage import get_storage
+from modules.catalog import get_catalog
+from modules.cart import Cart
+from modules.dispatcher import get_dispatcher, PRIORITY_INTERACTIVE
+from modules.ticket_pool import get_ticket_pool
+from modules.guild_config import get_config, get_guild_cache
+from modules.ticket_registry import get_order_registry
+from modules.sales import get_sales
+from modules.panels import publish_panel
+from modules.metrics import metrics, startup_phase, timed
+from modules.lifecycle import add_persistent_view, drain_views, hand_off_state, take_over_state
+
+SHOP_MESSAGES_FILE = "data/shop_messages.json"
+
+# Версия оформления сообщений товара; при изменении все сообщения редактируются один раз
+SHOP_RENDER_VERSION = 2
+
+# Настройки и объекты сервера, найденные при запуске
+config = get_config()
+guild_cache = get_guild_cache()
+
+# Хранилище, каталог товаров, открытые заказы и статистика продаж читают
+# данные, поэтому они привязываются в bind_services() при настройке модуля,
+# а не при импорте
+storage = None
+order_registry = None
+sales = None
+catalog = None
+
+def bind_services():
+    """Получение общих объектов процесса"""
+    global storage, order_registry, sales, catalog
+    storage = get_storage()
+    catalog = get_catalog()
+    order_registry = get_order_registry()
+    sales = get_sales()
+
+def cart_from_lines(lines):
+    """Корзина из сохранённых строк"""
+    # Старые строки корзин хранили только название товара - дополняем их ID,
+    # а строки товаров, которых больше нет в каталоге, отбрасываем
+    known_lines = []
+    for line in lines:
+        if line.get("item_id") is None:
+            item = catalog.find_by_name(line.get("name"))
+            if not item:
+                continue
+            line["item_id"] = item["id"]
+        known_lines.append(line)
+    return Cart.from_lines(known_lines)
+
+# Корзины пользователей; загружаются при настройке модуля или
+# передаются от его предыдущей версии при перезагрузке
+user_carts = {}
+
+def load_carts():
+    """Загрузка всех корзин из хранилища"""
+    return {user_id: cart_from_lines(lines) for user_id, lines in storage.load_carts().items()}
+
+def get_cart(user_id):
+    """Корзина пользователя (создаётся при первом обращении)"""
+    cart = user_carts.get(user_id)
+    if cart is None:
+        cart = user_carts[user_id] = Cart()
+    return cart
+
+# Корзины записываются в фоне, частые клики объединяются в одну запись
+CART_SAVE_DELAY = 2.0
+dirty_carts = set()
+
+def write_dirty_carts():
+    """Запись изменённых корзин в хранилище"""
+    user_ids = list(dirty_carts)
+    storage.save_carts({user_id: get_cart(user_id).to_lines() for user_id in user_ids})
+    dirty_carts.difference_update(user_ids)
+
+cart_writer = DebouncedWriter(write_dirty_carts, delay=CART_SAVE_DELAY)
+
+# Оформление заказов выполняется по очереди для каждого пользователя отдельно:
+# ID пользователя -> [блокировка, число ожидающих и выполняющих оформление]
+checkout_locks = {}
+
+# Ключ оформления -> ID канала тикета; повторная отправка формы возвращает тот же тикет
+CHECKOUT_KEY_LIMIT = 1000
+completed_checkouts = OrderedDict()
+
+@asynccontextmanager
+async def checkout_lock(user_id):
+    """Блокировка оформления заказа для пользователя
+
+    Запись удаляется, когда оформление завершено и его никто не ждёт.
+    """
+    entry = checkout_locks.get(user_id)
+    if entry is None:
+        entry = checkout_locks[user_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
     try:
-        with open(CART_DATA_FILE, "r") as f:
-            content = f.read().strip()
-            if content:
-                user_carts = json.loads(content)
-            else:
-                user_carts = {}
-    except (json.JSONDecodeError, FileNotFoundError):
-        user_carts = {}
-else:
-    user_carts = {}
-
-def save_cart_data():
-    """Сохранение данных корзин пользователей в файл"""
-    os.makedirs("data", exist_ok=True)
-    with open(CART_DATA_FILE, "w") as f:
-        json.dump(user_carts, f, ensure_ascii=False, indent=4)
-
-def save_shop_data():
-    """Сохранение данных магазина в файл"""
-    for index, item in enumerate(shop_items, start=1):
-        item["id"] = index
-    os.makedirs("data", exist_ok=True)
-    with open(SHOP_DATA_FILE, "w") as f:
-        json.dump(shop_items, f, ensure_ascii=False, indent=4)
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1] and checkout_locks.get(user_id) is entry:
+            del checkout_locks[user_id]
+
+def remember_checkout(checkout_key, channel_id):
+    """Запоминание тикета, созданного по ключу оформления"""
+    completed_checkouts[checkout_key] = channel_id
+    while len(completed_checkouts) > CHECKOUT_KEY_LIMIT:
+        completed_checkouts.popitem(last=False)
+
+def save_cart_data(user_id):
+    """Пометка корзины пользователя как изменённой для фоновой записи"""
+    dirty_carts.add(user_id)
+    cart_writer.mark_dirty()
 
 class ShopItemView(View):
-    def __init__(self, item_name, price):
+    """Кнопки товара
+
+    ID товара зашит в custom_id, а нажатия обрабатывает общий обработчик
+    shop_interaction_handler, поэтому кнопки работают и после перезапуска.
+    """
+
+    def __init__(self, item_id):
         super().__init__(timeout=None)
-        self.item_name = item_name
-        self.price = price
+        self.add_item(Button(label="✔ Добавить", style=discord.ButtonStyle.green, custom_id=f"shop_add_{item_id}"))
+        self.add_item(Button(label="✖ Убрать", style=discord.ButtonStyle.red, custom_id=f"shop_remove_{item_id}"))
+
+async def add_to_cart(interaction, item_id):
+    """Добавление товара в корзину"""
+    item = catalog.get(item_id)
+    if not item:
+        await interaction.response.send_message('❗ Этот товар больше не продаётся.', ephemeral=True, delete_after=10)
+        return
+    user_id = str(interaction.user.id)
+    cart = get_cart(user_id)
+    name, final_price = catalog.price(item["id"])
+    cart.add(item["id"], name, final_price)
+    save_cart_data(user_id)
+    quantity = cart.quantity(item["id"])
+    quantity_text = f" (×{quantity})" if quantity > 1 else ""
+    await interaction.response.send_message(f'✅ {item["name"]} добавлен в корзину!{quantity_text}', ephemeral=True, delete_after=10)
+
+async def remove_from_cart(interaction, item_id):
+    """Удаление одной единицы товара из корзины"""
+    item_id = int(item_id)
+    item = catalog.get(item_id)
+    user_id = str(interaction.user.id)
+    line = get_cart(user_id).remove(item_id)
+    if line:
+        save_cart_data(user_id)
+        await interaction.response.send_message(f'❌ {line["name"]} убран из корзины.', ephemeral=True, delete_after=10)
+        return
+    item_name = item["name"] if item else "Этого товара"
+    await interaction.response.send_message(f'❗ {item_name} нет в вашей корзине.', ephemeral=True, delete_after=10)
 
-    @discord.ui.button(label="✔ Добавить", style=discord.ButtonStyle.green)
-    async def add_to_cart(self, interaction: discord.Interaction, button: Button):
-        user_id = str(interaction.user.id)
-        if user_id not in user_carts:
-            user_carts[user_id] = []
-        user_carts[user_id].append({"name": self.item_name, "price": self.price})
-        save_cart_data()
-        await interaction.response.send_message(f'✅ {self.item_name} добавлен в корзину!', ephemeral=True, delete_after=10)
-
-    @discord.ui.button(label="✖ Убрать", style=discord.ButtonStyle.red)
-    async def remove_from_cart(self, interaction: discord.Interaction, button: Button):
-        user_id = str(interaction.user.id)
-        if user_id in user_carts:
-            for item in user_carts[user_id]:
-                if item["name"] == self.item_name:
-                    user_carts[user_id].remove(item)
-                    save_cart_data()
-                    await interaction.response.send_message(f'❌ {self.item_name} убран из корзины.', ephemeral=True, delete_after=10)
-                    return
-        await interaction.response.send_message(f'❗ {self.item_name} нет в вашей корзине.', ephemeral=True, delete_after=10)
+async def shop_interaction_handler(interaction):
+    """Общий обработчик кнопок товаров по custom_id
+
+    Замеряются только нажатия кнопок товаров, остальные взаимодействия
+    пропускаются без записи в метрики.
+    """
+    if interaction.type != discord.InteractionType.component:
+        return
+    custom_id = interaction.data.get("custom_id", "")
+    if custom_id.startswith("shop_add_"):
+        with metrics.span("interaction.shop_button"):
+            await add_to_cart(interaction, custom_id[len("shop_add_"):])
+    elif custom_id.startswith("shop_remove_"):
+        with metrics.span("interaction.shop_button"):
+            await remove_from_cart(interaction, custom_id[len("shop_remove_"):])
 
 class CartManagerView(View):
     def __init__(self):
         super().__init__(timeout=None)
 
-    @discord.ui.button(label="👁️‍🗨️ Посмотреть", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="👁️‍🗨️ Посмотреть", style=discord.ButtonStyle.primary, custom_id="cart_show")
+    @timed("interaction.CartManagerView.show_cart")
     async def show_cart(self, interaction: discord.Interaction, button: Button):
         user_id = str(interaction.user.id)
-        user_cart = user_carts.get(user_id, [])
+        user_cart = get_cart(user_id)
         if not user_cart:
             await interaction.response.send_message('❗ Ваша корзина пуста.', ephemeral=True)
             return
-        cart_description = "\n".join([f"- {item['name']}: {item['price']}р" for item in user_cart])
-        total_price = sum(item['price'] for item in user_cart)
-        embed = discord.Embed(title="🛒 Ваша корзина", description=cart_description, color=discord.Color.blue())
-        embed.add_field(name="Итого", value=f'{total_price}р', inline=False)
+        embed = discord.Embed(title="🛒 Ваша корзина", description=user_cart.describe_short(4096), color=discord.Color.blue())
+        embed.add_field(name="Итого", value=f'{user_cart.total}р', inline=False)
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    @discord.ui.button(label="🗑 Очистить", style=discord.ButtonStyle.danger)
+    @discord.ui.button(label="🗑 Очистить", style=discord.ButtonStyle.danger, custom_id="cart_clear")
+    @timed("interaction.CartManagerView.clear_cart")
     async def clear_cart(self, interaction: discord.Interaction, button: Button):
         user_id = str(interaction.user.id)
-        user_carts[user_id] = []
-        save_cart_data()
+        get_cart(user_id).clear()
+        save_cart_data(user_id)
         await interaction.response.send_message("🗑 Корзина очищена!", ephemeral=True)
 
-    @discord.ui.button(label="📝 К покупке", style=discord.ButtonStyle.success)
+    @discord.ui.button(label="📝 К покупке", style=discord.ButtonStyle.success, custom_id="cart_order")
+    @timed("interaction.CartManagerView.order")
     async def order(self, interaction: discord.Interaction, button: Button):
         user_id = str(interaction.user.id)
-        user_cart = user_carts.get(user_id, [])
+        user_cart = get_cart(user_id)
         if not user_cart:
             await interaction.response.send_message("❗ Ваша корзина пуста! Добавьте товары перед оформлением заказа.", ephemeral=True)
             return
-        await interaction.response.send_modal(OrderForm())
+        # Ключ меняется только при оформлении: формы, открытые для одной и той же
+        # корзины, оформляют один заказ
+        await interaction.response.send_modal(OrderForm(user_cart.checkout_token))
 
 class OrderForm(Modal, title="Форма заказа"):
-    def __init__(self):
+    def __init__(self, checkout_key):
         super().__init__()
+        self.checkout_key = checkout_key
         self.coords = TextInput(label="Координаты", placeholder="Введите координаты...")
         self.dimension = TextInput(label="Измерение", placeholder="Введите измерение...")
         self.username = TextInput(label="Ваш ник", placeholder="Введите ваш ник...")
@@ -136,50 +228,92 @@ class OrderForm(Modal, title="Форма заказа"):
         self.add_item(self.username)
         self.add_item(self.comment)
 
+    @timed("interaction.OrderForm.on_submit")
     async def on_submit(self, interaction: discord.Interaction):
         user_id = str(interaction.user.id)
-        if user_id not in user_carts or not user_carts[user_id]:
-            await interaction.response.send_message("❗ Ваша корзина пуста! Нельзя оформить заказ.", ephemeral=True)
-            return
-        await create_ticket(
-            interaction,
-            coords=self.coords.value,
-            dimension=self.dimension.value,
-            username=self.username.value,
-            comment=self.comment.value,
-            cart=user_carts[user_id]
-        )
-        user_carts[user_id] = []
-        save_cart_data()
-        await interaction.response.send_message("✅ Заказ оформлен! Тикет создан.", ephemeral=True)
 
+        # Ответ подтверждается сразу: повторная отправка формы ждёт первую
+        # и не должна истечь за время создания тикета
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        async with checkout_lock(user_id):
+            cart = get_cart(user_id)
+            channel_id = completed_checkouts.get(self.checkout_key)
+            if channel_id is not None:
+                await interaction.followup.send(f"✅ Этот заказ уже оформлен: <#{channel_id}>", ephemeral=True)
+                return
+
+            # Цены фиксируются по текущей ревизии каталога
+            prices_changed = False
+            if cart.revision != catalog.revision:
+                prices_changed = cart.reprice(catalog.price, revision=catalog.revision)
+                if prices_changed:
+                    save_cart_data(user_id)
+
+            if not cart:
+                await interaction.followup.send("❗ Ваша корзина пуста! Нельзя оформить заказ.", ephemeral=True)
+                return
+
+            # Снимок корзины берётся и корзина очищается до запросов к Discord
+            order_cart = cart.take()
+            save_cart_data(user_id)
+
+            try:
+                ticket_channel = await create_ticket(
+                    interaction,
+                    coords=self.coords.value,
+                    dimension=self.dimension.value,
+                    username=self.username.value,
+                    comment=self.comment.value,
+                    cart=order_cart
+                )
+            except Exception as e:
+                print(f"Ошибка при оформлении заказа: {e}")
+                await interaction.followup.send("❌ Не удалось оформить заказ, товары возвращены в корзину.", ephemeral=True)
+                ticket_channel = None
+            if ticket_channel is None:
+                cart.merge(order_cart)
+                save_cart_data(user_id)
+                return
+
+            remember_checkout(self.checkout_key, ticket_channel.id)
+            sales.record(ticket_channel.id, interaction.user.id, order_cart)
+
+        price_notice = "\n⚠️ Цены в корзине были обновлены по актуальному каталогу." if prices_changed else ""
+        await interaction.followup.send(f"✅ Заказ оформлен! Тикет создан: {ticket_channel.mention}{price_notice}", ephemeral=True)
+
+@timed("ticket.create_order")
 async def create_ticket(interaction, coords, dimension, username, comment, cart):
-    bot = interaction.client
-    guild_id = int(os.getenv("GUILD_ID"))
-    ticket_category_id = int(os.getenv("TICKET_CATEGORY_ID"))
-    guild = bot.get_guild(guild_id)
-    category = discord.utils.get(guild.categories, id=ticket_category_id)
+
+    # Категория и роли берутся из кеша сервера без перебора
+    category = guild_cache.ticket_category
     if not category:
         await interaction.followup.send("❌ Ошибка: категория тикетов не найдена.", ephemeral=True)
-        return
+        return None
 
-    overwrites = {
-        guild.default_role: discord.PermissionOverwrite(read_messages=False, send_messages=False),
-        guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True),
-        interaction.user: discord.PermissionOverwrite(read_messages=True, send_messages=True)
-    }
-
-    admin_role = discord.utils.get(guild.roles, name="Admin")
-    if admin_role:
-        overwrites[admin_role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+    overwrites = guild_cache.staff_overwrites()
+    overwrites[interaction.user] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
 
-    ticket_channel = await category.create_text_channel(
-        f'заказ-{interaction.user.name}',
-        overwrites=overwrites
-    )
+    # Канал берётся из запаса: нужны только переименование и права покупателя
+    ticket_channel = await get_ticket_pool().acquire(category, f'заказ-{interaction.user.name}', overwrites)
 
-    cart_description = "\n".join([f"- {item['name']}: {item['price']}р" for item in cart]) or "Пусто"
-    total_price = sum(item['price'] for item in cart)
+    # Заказ регистрируется сразу после получения канала: покупатель и состав
+    # доступны по ID канала без разбора названия
+    try:
+        order_registry.open(ticket_channel.id, interaction.user.id, cart, {
+            "coords": coords,
+            "dimension": dimension,
+            "username": username,
+            "comment": comment
+        })
+    except Exception:
+        # Канал не остаётся после неудачного оформления
+        await get_ticket_pool().discard(ticket_channel)
+        raise
+
+    # Описание укорачивается до лимита поля эмбеда
+    cart_description = cart.describe_short() or "Пусто"
+    total_price = cart.total
 
     embed = discord.Embed(title="📝 Новый заказ", color=discord.Color.orange())
     embed.add_field(name="Координаты", value=coords, inline=False)
@@ -191,8 +325,6 @@ async def create_ticket(interaction, coords, dimension, username, comment, cart)
     embed.add_field(name="Покупатель", value=f"{interaction.user.mention}", inline=False)
     embed.timestamp = discord.utils.utcnow()
 
-    await ticket_channel.send(embed=embed)
-
     # Информация о времени работы магазина
     time_notice_embed = discord.Embed(
         title="⏰ Время работы магазина",
@@ -207,116 +339,396 @@ async def create_ticket(interaction, coords, dimension, username, comment, cart)
         color=discord.Color.gold()
     )
 
-    await ticket_channel.send(embed=time_notice_embed)
-    await ticket_channel.send(embed=delivery_notice_embed)
-    await ticket_channel.send(f"{interaction.user.mention}, ваш заказ оформлен!")
+    # Заказ и уведомления отправляются одним сообщением
+    try:
+        await get_dispatcher().send(
+            ticket_channel,
+            PRIORITY_INTERACTIVE,
+            content=f"{interaction.user.mention}, ваш заказ оформлен!",
+            embeds=[embed, time_notice_embed, delivery_notice_embed]
+        )
+    except Exception:
+        # Канал и запись заказа не остаются после неудачного оформления
+        order_registry.cancel(ticket_channel.id)
+        await get_ticket_pool().discard(ticket_channel)
+        raise
+    return ticket_channel
+
+# Привязка товаров к сообщениям, файл читается один раз
+shop_messages = None
+shop_messages_loaded = False
+
+def load_shop_messages():
+    """Загрузка привязки товаров к опубликованным сообщениям"""
+    global shop_messages, shop_messages_loaded
+    if not shop_messages_loaded:
+        shop_messages = read_json_file(SHOP_MESSAGES_FILE, None)
+        shop_messages_loaded = True
+    return shop_messages
+
+def save_shop_messages(published):
+    """Сохранение привязки товаров к опубликованным сообщениям"""
+    global shop_messages, shop_messages_loaded
+    shop_messages = published
+    shop_messages_loaded = True
+    atomic_write_json(SHOP_MESSAGES_FILE, published)
+
+def render_shop_item(item):
+    """Формирование эмбеда и кнопок товара"""
+    original_price = item["price"]
+    discount = item.get("discount", 0)
+    final_price = original_price - discount
+
+    # Формирование описания с ценой и описанием товара
+    price_text = f'Цена: ~~{original_price}р~~ **{final_price}р**\n' if discount > 0 else f'Цена: {original_price}р\n'
+    description_text = item.get("description", "") or ""
+    full_description = f"{price_text}\n{description_text}" if description_text else price_text
+
+    embed = discord.Embed(
+        title=item["name"],
+        description=full_description,
+        color=discord.Color.green()
+    )
 
-async def update_shop(bot):
-    """Обновление канала магазина со всеми товарами"""
-    shop_channel_id = int(os.getenv("SHOP_CHANNEL_ID"))
-    channel = bot.get_channel(shop_channel_id)
-    if not channel:
-        print(f"❌ Канал магазина с ID {shop_channel_id} не найден")
+    if "image" in item and item["image"]:
+        embed.set_image(url=item["image"])
+
+    view = ShopItemView(item["id"])
+    return embed, view
+
+def embed_hash(embed):
+    """Хеш содержимого эмбеда для сравнения с опубликованной версией"""
+    payload = json.dumps([SHOP_RENDER_VERSION, embed.to_dict()], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+# Кеш отрисованных товаров: ID товара -> (версия, эмбед, кнопки, хеш)
+render_cache = {}
+
+def get_rendered_item(item):
+    """Эмбед, кнопки и хеш товара из кеша; отрисовка только при смене версии"""
+    version = catalog.version(item["id"])
+    cached = render_cache.get(item["id"])
+    if cached and cached[0] == version:
+        return cached[1:]
+    embed, view = render_shop_item(item)
+    rendered = (embed, view, embed_hash(embed))
+    render_cache[item["id"]] = (version, *rendered)
+    return rendered
+
+# Товары, цены которых нужно обновить в корзинах
+pending_reprice = set()
+reprice_handle = None
+REPRICE_DELAY = 0.5
+
+def reprice_carts():
+    """Обновление цен изменившихся товаров во всех корзинах одним проходом"""
+    global reprice_handle
+    reprice_handle = None
+    item_ids = set(pending_reprice)
+    pending_reprice.clear()
+    for user_id, cart in user_carts.items():
+        if cart.reprice(catalog.price, item_ids, revision=catalog.revision):
+            save_cart_data(user_id)
+
+def on_catalog_change(event, item):
+    """Сброс кеша отрисовки и планирование пересчёта цен в корзинах"""
+    global reprice_handle
+    render_cache.pop(item["id"], None)
+    if event == "add":
         return
+    pending_reprice.add(item["id"])
+    if reprice_handle is None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            reprice_carts()
+            return
+        # Несколько изменений подряд обрабатываются одним проходом
+        reprice_handle = loop.call_later(REPRICE_DELAY, reprice_carts)
+
+def resolve_item_channel(bot, item, shop_channel_id):
+    """Определение канала, в котором должен быть опубликован товар"""
+    channel_id = item.get("channel_id")
+    # Если канал указан и он существует, товар публикуется в нём
+    if channel_id and bot.get_channel(int(channel_id)):
+        return int(channel_id)
+    # Иначе товар публикуется в основном канале магазина
+    return shop_channel_id
+
+async def purge_legacy_shop_messages(bot, shop_channel_id):
+    """Удаление старых сообщений с товарами, не привязанных к товарам"""
+    dispatcher = get_dispatcher()
 
     # Получение всех каналов, в которых есть товары
     channel_ids = set([shop_channel_id])
-    for item in shop_items:
-        if item.get("channel_id"):
-            channel_ids.add(int(item.get("channel_id")))
+    for channel_id in catalog.by_channel:
+        if channel_id:
+            channel_ids.add(int(channel_id))
 
-    # Удаление только сообщений бота с товарами в каждом канале
     for channel_id in channel_ids:
         target_channel = bot.get_channel(channel_id)
         if not target_channel:
             print(f"❌ Канал с ID {channel_id} не найден")
             continue
-            
-        # Удаление только сообщений бота
-        async for message in target_channel.history(limit=200):
-            # Проверка, что сообщение от бота и содержит эмбед (товар)
-            if message.author == bot.user and message.embeds and len(message.embeds) > 0:
-                try:
-                    await message.delete()
-                except Exception as e:
-                    print(f"Ошибка при удалении сообщения: {e}")
-                    
-        print(f"✅ Удалены старые товары в канале {target_channel.name}")
 
-    # Группировка товаров по каналам
-    channel_items = {}
-    # Основной канал магазина
-    channel_items[shop_channel_id] = []
-    
-    # Группировка товаров по указанным каналам
-    for item in shop_items:
-        channel_id = item.get("channel_id")
-        
-        # Если канал указан и он существует, товар добавляется в этот канал
-        if channel_id and bot.get_channel(int(channel_id)):
-            if int(channel_id) not in channel_items:
-                channel_items[int(channel_id)] = []
-            channel_items[int(channel_id)].append(item)
-        else:
-            # Иначе товар добавляется в основной канал магазина
-            channel_items[shop_channel_id].append(item)
+        # Удаление только сообщений бота, содержащих эмбед (товар)
+        message_ids = [
+            message.id async for message in target_channel.history(limit=200)
+            if message.author == bot.user and message.embeds
+        ]
+        await dispatcher.bulk_delete(target_channel, message_ids)
 
-    # Публикация товаров в соответствующих каналах
-    for channel_id, items in channel_items.items():
+        print(f"✅ Удалены старые товары в канале {target_channel.name}")
+
+async def publish_shop_item(bot, item_id, item, channel_id, entry, published):
+    """Публикация нового или редактирование изменившегося товара
+
+    Возвращает "sent", "edited" или None, если публиковать было некуда.
+    """
+    dispatcher = get_dispatcher()
+    target_channel = bot.get_channel(channel_id)
+    if not target_channel:
+        print(f"❌ Канал с ID {channel_id} не найден")
+        return None
+
+    embed, view, digest = get_rendered_item(item)
+
+    if entry:
+        try:
+            await dispatcher.edit_message(target_channel, entry["message_id"], embed=embed, view=view)
+            entry["hash"] = digest
+            return "edited"
+        except discord.NotFound:
+            # Сообщение удалено вручную - товар публикуется заново
+            pass
+
+    message = await dispatcher.send(target_channel, embed=embed, view=view)
+    published[item_id] = {
+        "channel_id": channel_id,
+        "message_id": message.id,
+        "hash": digest
+    }
+    return "sent"
+
+# Сверки витрины выполняются по одной: первая публикация при запуске,
+# фоновое обновление и команды меняют общую карту опубликованных сообщений
+shop_update_lock = asyncio.Lock()
+
+async def update_shop(bot, force=False):
+    """Синхронизация каналов магазина с текущим списком товаров
+
+    Публикуются только новые товары, редактируются только изменившиеся
+    и удаляются только убранные. При force=True все сообщения
+    редактируются заново.
+    Запросы к Discord выполняются параллельно через общую очередь, а
+    одновременные вызовы ждут завершения текущей сверки. Возвращает False,
+    если публиковать некуда (канал магазина не найден).
+    """
+    async with shop_update_lock:
+        return await reconcile_shop(bot, force)
+
+@timed("shop.update")
+async def reconcile_shop(bot, force=False):
+    """Одна сверка витрины; вызывается только через update_shop"""
+    shop_channel_id = config.shop_channel_id
+    channel = bot.get_channel(shop_channel_id)
+    if not channel:
+        print(f"❌ Канал магазина с ID {shop_channel_id} не найден")
+        return False
+
+    dispatcher = get_dispatcher()
+
+    published = load_shop_messages()
+    if published is None:
+        # Сообщения ещё не привязаны к товарам - старые публикации удаляются один раз
+        await purge_legacy_shop_messages(bot, shop_channel_id)
+        published = {}
+
+    # Желаемое состояние: товар -> канал публикации
+    desired = {}
+    for item in catalog:
+        desired[str(item["id"])] = (item, resolve_item_channel(bot, item, shop_channel_id))
+
+    # Сообщения убранных товаров и товаров, перенесённых в другой канал, группируются по каналам
+    stale = {}
+    for item_id, entry in list(published.items()):
+        target = desired.get(item_id)
+        if target is None or target[1] != entry["channel_id"]:
+            stale.setdefault(entry["channel_id"], []).append(entry["message_id"])
+            del published[item_id]
+
+    deletions = []
+    for channel_id, message_ids in stale.items():
         target_channel = bot.get_channel(channel_id)
-        
-        if not target_channel:
-            print(f"❌ Канал с ID {channel_id} не найден")
+        if target_channel:
+            deletions.append(dispatcher.bulk_delete(target_channel, message_ids))
+    await asyncio.gather(*deletions)
+    deleted = sum(len(message_ids) for message_ids in stale.values())
+
+    # Публикация новых и редактирование изменившихся товаров
+    jobs = []
+    for item_id, (item, channel_id) in desired.items():
+        entry = published.get(item_id)
+        if entry and not force and entry["hash"] == get_rendered_item(item)[2]:
             continue
-        
-        # Публикация товаров
-        for item in items:
-            original_price = item["price"]
-            discount = item.get("discount", 0)
-            final_price = original_price - discount
-            
-            # Формирование описания с ценой и описанием товара
-            price_text = f'Цена: ~~{original_price}р~~ **{final_price}р**\n' if discount > 0 else f'Цена: {original_price}р\n'
-            description_text = item.get("description", "") or ""
-            full_description = f"{price_text}\n{description_text}" if description_text else price_text
-            
-            embed = discord.Embed(
-                title=item["name"], 
-                description=full_description,
-                color=discord.Color.green()
-            )
-            
-            if "image" in item and item["image"]:
-                embed.set_image(url=item["image"])
-            
-            view = ShopItemView(item["name"], final_price)
-            await target_channel.send(embed=embed, view=view)
-
-        print(f"✅ Товары опубликованы в {len(channel_items)} каналах")
-
-async def update_cart_channel(bot):
-    """Обновление канала корзины с менеджером корзины"""
-    cart_channel_id = int(os.getenv("CART_CHANNEL_ID"))
+        jobs.append(publish_shop_item(bot, item_id, item, channel_id, entry, published))
+
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Ошибка при публикации товара: {result}")
+
+    save_shop_messages(published)
+    print(f"✅ Магазин обновлён: добавлено {results.count('sent')}, "
+          f"изменено {results.count('edited')}, удалено {deleted}")
+    return True
+
+class ShopUpdateJob:
+    """Фоновое обновление магазина с объединением запросов
+
+    Запросы, пришедшие за время ожидания или во время текущего обновления,
+    выполняются одним следующим запуском update_shop.
+    """
+
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self.task = None
+        self.waiters = []
+
+    def request(self, bot):
+        """Запрос обновления; возвращает future с результатом update_shop
+
+        Результат False означает, что витрина не опубликована.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.waiters.append(future)
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self._run(bot))
+        return future
+
+    async def _run(self, bot):
+        while self.waiters:
+            # Короткая пауза, чтобы собрать несколько изменений подряд в один запуск
+            await asyncio.sleep(self.delay)
+            waiters, self.waiters = self.waiters, []
+            try:
+                published = await update_shop(bot)
+            except Exception as e:
+                print(f"Ошибка при обновлении магазина: {e}")
+                for future in waiters:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future in waiters:
+                    if not future.done():
+                        future.set_result(published)
+
+shop_update_job = ShopUpdateJob()
+
+def request_shop_update(bot):
+    """Постановка обновления магазина в фоновую задачу"""
+    return shop_update_job.request(bot)
+
+@timed("shop.update_cart_channel")
+async def update_cart_channel(bot, force=False):
+    """Обновление канала корзины с менеджером корзины
+
+    Сообщение публикуется заново только если его содержимое изменилось.
+    """
+    cart_channel_id = config.cart_channel_id
     channel = bot.get_channel(cart_channel_id)
     if not channel:
         return
 
-    # Удаление только сообщений бота с управлением корзиной
-    async for message in channel.history(limit=50):
-        if message.author == bot.user and message.embeds and len(message.embeds) > 0:
-            try:
-                # Проверка, что это сообщение с управлением корзиной
-                if message.embeds[0].title == "🛒 Управление корзиной":
-                    await message.delete()
-            except Exception as e:
-                print(f"Ошибка при удалении сообщения корзины: {e}")
+    async def cleanup():
+        # Удаление только сообщений бота с управлением корзиной
+        message_ids = [
+            message.id async for message in channel.history(limit=50)
+            if message.author == bot.user and message.embeds
+            and message.embeds[0].title == "🛒 Управление корзиной"
+        ]
+        await get_dispatcher().bulk_delete(channel, message_ids)
 
     embed = discord.Embed(title="🛒 Управление корзиной", description="Нажмите кнопку, чтобы взаимодействовать с корзиной", color=discord.Color.gold())
     view = CartManagerView()
-    await channel.send(embed=embed, view=view)
+    await publish_panel(channel, "cart", embed, view, cleanup, force=force)
 
 async def setup_shop(bot):
     """Инициализация магазина и корзины"""
-    await update_shop(bot)
-    await update_cart_channel(bot)
+    global user_carts, dirty_carts, checkout_locks, completed_checkouts, shop_messages, shop_messages_loaded
+
+    # При перезагрузке модуля корзины, незаписанные изменения и оформляемые
+    # заказы переходят от предыдущей версии без повторного чтения хранилища
+    with startup_phase("shop.load_data"):
+        bind_services()
+        state = take_over_state(bot, __name__)
+        if state is None:
+            user_carts = load_carts()
+        else:
+            user_carts = state["user_carts"]
+            dirty_carts = state["dirty_carts"]
+            checkout_locks = state["checkout_locks"]
+            completed_checkouts = state["completed_checkouts"]
+            shop_messages = state["shop_messages"]
+            shop_messages_loaded = state["shop_messages_loaded"]
+            if dirty_carts:
+                cart_writer.mark_dirty()
+
+    catalog.subscribe("shop_system", on_catalog_change)
+
+    # Общий обработчик кнопок товаров
+    bot.add_listener(shop_interaction_handler, "on_interaction")
+
+    # Постоянная панель корзины продолжает работать после перезапуска
+    add_persistent_view(bot, __name__, CartManagerView())
+
+    # Запас каналов тикетов пополняется в фоне
+    get_ticket_pool().start(bot)
+
+    if state is None:
+        # Кнопки постоянные, поэтому в Discord публикуются только изменения
+        with startup_phase("shop.update_shop"):
+            await update_shop(bot)
+        with startup_phase("shop.update_cart_channel"):
+            await update_cart_channel(bot)
+    else:
+        # После перезагрузки витрина сверяется в фоне, сообщения не публикуются заново
+        request_shop_update(bot)
     print("✅ Модуль магазина загружен")
+
+async def teardown_shop(bot):
+    """Выгрузка модуля: завершение фоновых работ и передача состояния новой версии"""
+    drain_views(bot, __name__)
+    bot.remove_listener(shop_interaction_handler, "on_interaction")
+    catalog.unsubscribe("shop_system")
+
+    # Отложенный пересчёт цен выполняется сразу
+    if reprice_handle is not None:
+        reprice_handle.cancel()
+        reprice_carts()
+
+    # Начатое обновление витрины завершается старой версией
+    task = shop_update_job.task
+    if task is not None and not task.done():
+        try:
+            await task
+        except Exception as e:
+            print(f"Ошибка при обновлении магазина: {e}")
+
+    cart_writer.flush()
+    hand_off_state(bot, __name__, {
+        "user_carts": user_carts,
+        "dirty_carts": dirty_carts,
+        "checkout_locks": checkout_locks,
+        "completed_checkouts": completed_checkouts,
+        "shop_messages": shop_messages,
+        "shop_messages_loaded": shop_messages_loaded
+    })
+
+# Точки входа расширения discord.py
+async def setup(bot):
+    await setup_shop(bot)
+
+async def teardown(bot):
+    await teardown_shop(bot)
@@ -0,0 +1,393 @@
+import json
+import os
+import sqlite3
+import sys
+
+from modules.metrics import metrics
+from modules.persistence import append_json_line, atomic_write_json, flush_writes, read_json_file, submit_write
+
+SHOP_DATA_FILE = "data/shop_data.json"
+CART_DATA_FILE = "data/user_carts.json"
+EXCHANGES_FILE = "data/exchanges/exchanges.json"
+EXCHANGE_ARCHIVE_FILE = "data/exchanges/archive.jsonl"
+ORDERS_FILE = "data/orders/orders.json"
+ORDER_ARCHIVE_FILE = "data/orders/archive.jsonl"
+SHOP_META_FILE = "data/shop_meta.json"
+DATABASE_FILE = "data/keepershop.db"
+
+class Storage:
+    """Базовый интерфейс хранилища товаров, корзин и тикетов сделок"""
+
+    # Товары
+    def load_items(self):
+        raise NotImplementedError
+
+    def save_item(self, item):
+        raise NotImplementedError
+
+    def delete_item(self, item_id):
+        raise NotImplementedError
+
+    def replace_items(self, items):
+        raise NotImplementedError
+
+    # Корзины
+    def load_carts(self):
+        raise NotImplementedError
+
+    def save_carts(self, carts):
+        """Запись корзин только указанных пользователей"""
+        raise NotImplementedError
+
+    # Тикеты сделок
+    def load_exchanges(self):
+        raise NotImplementedError
+
+    def get_ticket(self, channel_id):
+        raise NotImplementedError
+
+    def save_ticket(self, channel_id, ticket_info):
+        raise NotImplementedError
+
+    def archive_ticket(self, channel_id, ticket_info):
+        """Перенос закрытого тикета из активных в архив"""
+        raise NotImplementedError
+
+    # Тикеты заказов
+    def load_orders(self):
+        """Открытые тикеты заказов: ID канала -> информация о заказе"""
+        raise NotImplementedError
+
+    def save_order(self, channel_id, order_info):
+        raise NotImplementedError
+
+    def archive_order(self, channel_id, order_info):
+        """Перенос закрытого заказа в историю"""
+        raise NotImplementedError
+
+    # Служебные значения (счётчики и т.п.)
+    def get_meta(self, key, default=None):
+        raise NotImplementedError
+
+    def set_meta(self, key, value):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class JsonStorage(Storage):
+    """Хранилище в JSON-файлах: каждое изменение перезаписывает файл целиком
+
+    Запись выполняется в потоке записи, подряд идущие изменения одного файла
+    объединяются в одну запись.
+    """
+
+    def __init__(self):
+        self.items = None
+        self.carts = None
+        self.exchanges = None
+        self.orders = None
+        self.meta = None
+
+    def load_items(self):
+        self.items = read_json_file(SHOP_DATA_FILE, [])
+        return [dict(item) for item in self.items]
+
+    def save_item(self, item):
+        if self.items is None:
+            self.load_items()
+        for index, stored in enumerate(self.items):
+            if stored["id"] == item["id"]:
+                self.items[index] = dict(item)
+                break
+        else:
+            self.items.append(dict(item))
+        atomic_write_json(SHOP_DATA_FILE, self.items)
+
+    def delete_item(self, item_id):
+        if self.items is None:
+            self.load_items()
+        self.items = [item for item in self.items if item["id"] != item_id]
+        atomic_write_json(SHOP_DATA_FILE, self.items)
+
+    def replace_items(self, items):
+        self.items = [dict(item) for item in items]
+        atomic_write_json(SHOP_DATA_FILE, self.items)
+
+    def load_carts(self):
+        self.carts = read_json_file(CART_DATA_FILE, {})
+        return {user_id: list(cart) for user_id, cart in self.carts.items()}
+
+    def save_carts(self, carts):
+        if self.carts is None:
+            self.load_carts()
+        for user_id, cart in carts.items():
+            if cart:
+                self.carts[user_id] = list(cart)
+            else:
+                self.carts.pop(user_id, None)
+        atomic_write_json(CART_DATA_FILE, self.carts)
+
+    def load_exchanges(self):
+        self.exchanges = read_json_file(EXCHANGES_FILE, {"exchanges": [], "active_tickets": {}})
+        return self.exchanges
+
+    def get_ticket(self, channel_id):
+        if self.exchanges is None:
+            self.load_exchanges()
+        return self.exchanges["active_tickets"].get(str(channel_id))
+
+    def save_ticket(self, channel_id, ticket_info):
+        if self.exchanges is None:
+            self.load_exchanges()
+        self.exchanges["active_tickets"][str(channel_id)] = ticket_info
+        atomic_write_json(EXCHANGES_FILE, self.exchanges)
+
+    def archive_ticket(self, channel_id, ticket_info):
+        if self.exchanges is None:
+            self.load_exchanges()
+        # Архив только дописывается, в основном файле остаются открытые тикеты
+        append_json_line(EXCHANGE_ARCHIVE_FILE, {"channel_id": str(channel_id), **ticket_info})
+        self.exchanges["active_tickets"].pop(str(channel_id), None)
+        atomic_write_json(EXCHANGES_FILE, self.exchanges)
+
+    def load_orders(self):
+        self.orders = read_json_file(ORDERS_FILE, {})
+        return dict(self.orders)
+
+    def save_order(self, channel_id, order_info):
+        if self.orders is None:
+            self.load_orders()
+        self.orders[str(channel_id)] = order_info
+        atomic_write_json(ORDERS_FILE, self.orders)
+
+    def archive_order(self, channel_id, order_info):
+        if self.orders is None:
+            self.load_orders()
+        append_json_line(ORDER_ARCHIVE_FILE, {"channel_id": str(channel_id), **order_info})
+        self.orders.pop(str(channel_id), None)
+        atomic_write_json(ORDERS_FILE, self.orders)
+
+    def get_meta(self, key, default=None):
+        if self.meta is None:
+            self.meta = read_json_file(SHOP_META_FILE, {})
+        return self.meta.get(key, default)
+
+    def set_meta(self, key, value):
+        if self.meta is None:
+            self.meta = read_json_file(SHOP_META_FILE, {})
+        self.meta[key] = value
+        atomic_write_json(SHOP_META_FILE, self.meta)
+
+class SqliteStorage(Storage):
+    """Хранилище в SQLite: изменения записываются построчно
+
+    Чтение идёт через основное соединение, запись - через отдельное
+    соединение в потоке записи, поэтому цикл событий не ждёт диска.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            id INTEGER PRIMARY KEY,
+            channel_id INTEGER,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_items_channel ON items (channel_id);
+
+        CREATE TABLE IF NOT EXISTS cart_lines (
+            user_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user_id, position)
+        );
+
+        CREATE TABLE IF NOT EXISTS exchange_tickets (
+            channel_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL,
+            author_id INTEGER,
+            partner_id INTEGER,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tickets_status ON exchange_tickets (status);
+
+        CREATE TABLE IF NOT EXISTS order_tickets (
+            channel_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL,
+            buyer_id INTEGER,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_orders_status ON order_tickets (status);
+
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path=DATABASE_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+        # Соединение для записи используется только в потоке записи
+        self.writer = sqlite3.connect(path, check_same_thread=False)
+        self.writer.execute("PRAGMA synchronous=NORMAL")
+
+    def _run_writes(self, statements):
+        with metrics.span("disk.sqlite"), self.writer:
+            for sql, params in statements:
+                if isinstance(params, list):
+                    self.writer.executemany(sql, params)
+                else:
+                    self.writer.execute(sql, params)
+
+    def _write(self, *statements):
+        """Выполнение запросов одной транзакцией в потоке записи"""
+        return submit_write(self._run_writes, list(statements))
+
+    def is_empty(self):
+        for table in ("items", "cart_lines", "exchange_tickets", "order_tickets"):
+            if self.conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                return False
+        return True
+
+    def load_items(self):
+        rows = self.conn.execute("SELECT data FROM items ORDER BY id")
+        return [json.loads(data) for (data,) in rows]
+
+    ITEM_UPSERT = "INSERT OR REPLACE INTO items (id, channel_id, data) VALUES (?, ?, ?)"
+
+    def _item_row(self, item):
+        channel_id = int(item["channel_id"]) if item.get("channel_id") else None
+        return (item["id"], channel_id, json.dumps(item, ensure_ascii=False))
+
+    def save_item(self, item):
+        self._write((self.ITEM_UPSERT, self._item_row(item)))
+
+    def delete_item(self, item_id):
+        self._write(("DELETE FROM items WHERE id = ?", (item_id,)))
+
+    def replace_items(self, items):
+        self._write(
+            ("DELETE FROM items", ()),
+            (self.ITEM_UPSERT, [self._item_row(item) for item in items])
+        )
+
+    def load_carts(self):
+        carts = {}
+        rows = self.conn.execute("SELECT user_id, data FROM cart_lines ORDER BY user_id, position")
+        for user_id, data in rows:
+            carts.setdefault(user_id, []).append(json.loads(data))
+        return carts
+
+    def save_carts(self, carts):
+        statements = []
+        for user_id, cart in carts.items():
+            statements.append(("DELETE FROM cart_lines WHERE user_id = ?", (user_id,)))
+            statements.append((
+                "INSERT INTO cart_lines (user_id, position, data) VALUES (?, ?, ?)",
+                [(user_id, position, json.dumps(line, ensure_ascii=False))
+                 for position, line in enumerate(cart)]
+            ))
+        self._write(*statements)
+
+    def load_exchanges(self):
+        rows = self.conn.execute("SELECT channel_id, data FROM exchange_tickets WHERE status = 'open'")
+        return {
+            "exchanges": [],
+            "active_tickets": {str(channel_id): json.loads(data) for channel_id, data in rows}
+        }
+
+    def get_ticket(self, channel_id):
+        row = self.conn.execute(
+            "SELECT data FROM exchange_tickets WHERE channel_id = ?", (int(channel_id),)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_ticket(self, channel_id, ticket_info):
+        self._write((
+            "INSERT OR REPLACE INTO exchange_tickets (channel_id, status, author_id, partner_id, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (int(channel_id), ticket_info.get("status", "open"), ticket_info.get("author_id"),
+             ticket_info.get("partner_id"), json.dumps(ticket_info, ensure_ascii=False))
+        ))
+
+    def archive_ticket(self, channel_id, ticket_info):
+        # Закрытые тикеты остаются в таблице, но отсекаются индексом по статусу
+        self.save_ticket(channel_id, ticket_info)
+
+    def load_orders(self):
+        rows = self.conn.execute("SELECT channel_id, data FROM order_tickets WHERE status = 'open'")
+        return {str(channel_id): json.loads(data) for channel_id, data in rows}
+
+    def save_order(self, channel_id, order_info):
+        self._write((
+            "INSERT OR REPLACE INTO order_tickets (channel_id, status, buyer_id, data) VALUES (?, ?, ?, ?)",
+            (int(channel_id), order_info.get("status", "open"), order_info.get("buyer_id"),
+             json.dumps(order_info, ensure_ascii=False))
+        ))
+
+    def archive_order(self, channel_id, order_info):
+        # Закрытые заказы остаются в таблице и отсекаются индексом по статусу
+        self.save_order(channel_id, order_info)
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        self._write(("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value))))
+
+    def close(self):
+        flush_writes()
+        self.writer.close()
+        self.conn.close()
+
+def import_json_data(storage):
+    """Однократный перенос данных из JSON-файлов в хранилище"""
+    items = read_json_file(SHOP_DATA_FILE, [])
+    carts = read_json_file(CART_DATA_FILE, {})
+    exchanges = read_json_file(EXCHANGES_FILE, {"exchanges": [], "active_tickets": {}})
+    orders = read_json_file(ORDERS_FILE, {})
+    meta = read_json_file(SHOP_META_FILE, {})
+
+    storage.replace_items(items)
+    for key, value in meta.items():
+        storage.set_meta(key, value)
+    storage.save_carts(carts)
+    for channel_id, ticket_info in exchanges.get("active_tickets", {}).items():
+        storage.save_ticket(channel_id, ticket_info)
+    for channel_id, order_info in orders.items():
+        storage.save_order(channel_id, order_info)
+
+    print(f"✅ Импортировано: товаров {len(items)}, корзин {len(carts)}, "
+          f"тикетов {len(exchanges.get('active_tickets', {}))}, заказов {len(orders)}")
+
+_storage = None
+
+def get_storage():
+    """Общее хранилище, выбранное переменной STORAGE_BACKEND (json или sqlite)"""
+    global _storage
+    if _storage is None:
+        backend = os.getenv("STORAGE_BACKEND", "json").strip().lower()
+        if backend == "sqlite":
+            _storage = SqliteStorage()
+            # При первом запуске данные переносятся из JSON-файлов
+            if _storage.is_empty():
+                import_json_data(_storage)
+                flush_writes()
+        else:
+            _storage = JsonStorage()
+    return _storage
+
+if __name__ == "__main__":
+    # Ручной импорт: python -m modules.storage import
+    if len(sys.argv) > 1 and sys.argv[1] == "import":
+        import_json_data(SqliteStorage())
+    else:
+        print("Использование: python -m modules.storage import")
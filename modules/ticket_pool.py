@@ -0,0 +1,106 @@
+import asyncio
+
+import discord
+
+from modules.dispatcher import get_dispatcher, PRIORITY_INTERACTIVE
+from modules.guild_config import get_config, get_guild_cache
+
+# Название свободного заранее созданного канала тикета
+POOL_CHANNEL_NAME = "тикет-резерв"
+
+class TicketPool:
+    """Запас заранее созданных скрытых каналов тикетов
+
+    Каналы создаются в фоне в категории тикетов и видны только боту и
+    администраторам. При оформлении канал только переименовывается и получает
+    права участников одним запросом, после чего запас пополняется.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.bot = None
+        self.channels = []
+        self._refill_task = None
+
+    def start(self, bot):
+        """Подхват свободных каналов после перезапуска и пополнение запаса"""
+        self.bot = bot
+        category = get_guild_cache().ticket_category
+        if category:
+            known = {channel.id for channel in self.channels}
+            self.channels += [
+                channel for channel in category.text_channels
+                if channel.name == POOL_CHANNEL_NAME and channel.id not in known
+            ]
+        self.refill()
+
+    def refill(self):
+        """Фоновое пополнение запаса до нужного размера"""
+        if self.bot is None or self.size <= 0:
+            return
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def _refill(self):
+        cache = get_guild_cache()
+        category = cache.ticket_category
+        if not category:
+            return
+        dispatcher = get_dispatcher()
+        while len(self.channels) < self.size:
+            try:
+                channel = await dispatcher.submit(
+                    lambda: category.create_text_channel(
+                        POOL_CHANNEL_NAME, overwrites=cache.staff_overwrites()
+                    ),
+                    ("create_channel", category.id)
+                )
+            except discord.HTTPException as e:
+                print(f"Ошибка при создании резервного канала тикета: {e}")
+                return
+            self.channels.append(channel)
+
+    async def acquire(self, category, name, overwrites, topic=None):
+        """Канал тикета с нужным названием и правами
+
+        Берётся свободный канал из запаса, а если запас пуст - создаётся новый.
+        """
+        dispatcher = get_dispatcher()
+        while self.channels:
+            channel = self.channels.pop()
+            if self.bot and not self.bot.get_channel(channel.id):
+                # Канал удалён вручную
+                continue
+            try:
+                edited = await dispatcher.submit(
+                    lambda: channel.edit(name=name, overwrites=overwrites, topic=topic),
+                    ("channel", channel.id),
+                    PRIORITY_INTERACTIVE
+                )
+            except discord.NotFound:
+                continue
+            self.refill()
+            return edited or channel
+
+        self.refill()
+        return await dispatcher.submit(
+            lambda: category.create_text_channel(name, overwrites=overwrites, topic=topic),
+            ("create_channel", category.id),
+            PRIORITY_INTERACTIVE
+        )
+
+    async def discard(self, channel):
+        """Удаление канала тикета, оформление которого не удалось"""
+        try:
+            await get_dispatcher().submit(lambda: channel.delete(), ("channel", channel.id))
+        except discord.HTTPException as e:
+            print(f"Ошибка при удалении канала тикета: {e}")
+
+_pool = None
+
+def get_ticket_pool():
+    """Общий для всего процесса запас каналов тикетов"""
+    global _pool
+    if _pool is None:
+        _pool = TicketPool(get_config().ticket_pool_size)
+    return _pool
@@ -0,0 +1,173 @@
+from datetime import datetime
+
+from modules.storage import get_storage
+
+class ExchangeRegistry:
+    """Реестр открытых тикетов сделок в памяти
+
+    Загружается один раз за время работы процесса. Тикеты индексируются
+    по ID канала и по участникам, закрытые тикеты уходят в архив. Время
+    последней активности в тикете (last_activity) хранится только в памяти:
+    при загрузке это время создания тикета, дальше его обновляют сообщения.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.by_channel = {}
+        self.by_user = {}
+        self.last_activity = {}
+        self.load()
+
+    def load(self):
+        """Загрузка открытых тикетов из хранилища"""
+        self.by_channel = {}
+        self.by_user = {}
+        self.last_activity = {}
+        exchanges = self.storage.load_exchanges()
+        for channel_id, ticket_info in list(exchanges.get("active_tickets", {}).items()):
+            if ticket_info.get("status", "open") == "open":
+                self._index(channel_id, ticket_info)
+            else:
+                # Закрытые тикеты из старых данных переносятся в архив
+                self.storage.archive_ticket(channel_id, ticket_info)
+
+    def _index(self, channel_id, ticket_info):
+        channel_id = str(channel_id)
+        self.by_channel[channel_id] = ticket_info
+        for user_id in (ticket_info["author_id"], ticket_info["partner_id"]):
+            self.by_user.setdefault(user_id, set()).add(channel_id)
+        self.last_activity[channel_id] = datetime.fromisoformat(ticket_info["created_at"]).timestamp()
+
+    def _unindex(self, channel_id):
+        self.last_activity.pop(str(channel_id), None)
+        ticket_info = self.by_channel.pop(str(channel_id), None)
+        if ticket_info:
+            for user_id in (ticket_info["author_id"], ticket_info["partner_id"]):
+                channels = self.by_user.get(user_id)
+                if channels:
+                    channels.discard(str(channel_id))
+                    if not channels:
+                        del self.by_user[user_id]
+        return ticket_info
+
+    def get(self, channel_id):
+        """Информация об открытом тикете по ID канала"""
+        return self.by_channel.get(str(channel_id))
+
+    def find_between(self, first_id, second_id):
+        """ID канала открытого тикета между двумя пользователями"""
+        common = self.by_user.get(first_id, set()) & self.by_user.get(second_id, set())
+        return next(iter(common), None)
+
+    def touch(self, channel_id, timestamp):
+        """Отметка активности в открытом тикете (timestamp - время в секундах)"""
+        channel_id = str(channel_id)
+        if timestamp > self.last_activity.get(channel_id, timestamp):
+            self.last_activity[channel_id] = timestamp
+
+    def inactive(self, ttl, now):
+        """ID каналов тикетов без активности дольше ttl секунд, от самых старых"""
+        deadline = now - ttl
+        expired = [(last, channel_id) for channel_id, last in self.last_activity.items() if last < deadline]
+        return [channel_id for _, channel_id in sorted(expired)]
+
+    def open(self, channel_id, author_id, partner_id):
+        """Регистрация нового тикета"""
+        ticket_info = {
+            "author_id": author_id,
+            "partner_id": partner_id,
+            "created_at": datetime.now().isoformat(),
+            "status": "open"
+        }
+        self._index(channel_id, ticket_info)
+        self.storage.save_ticket(channel_id, ticket_info)
+        return ticket_info
+
+    def close(self, channel_id, closed_by, reason=None):
+        """Закрытие тикета и перенос его в архив"""
+        ticket_info = self._unindex(channel_id)
+        if not ticket_info:
+            return None
+        ticket_info["status"] = "closed"
+        ticket_info["closed_at"] = datetime.now().isoformat()
+        ticket_info["closed_by"] = closed_by
+        if reason:
+            ticket_info["close_reason"] = reason
+        self.storage.archive_ticket(channel_id, ticket_info)
+        return ticket_info
+
+class OrderRegistry:
+    """Реестр открытых тикетов заказов в памяти
+
+    Запись создаётся при оформлении заказа и хранит покупателя, состав
+    заказа и суммы, поэтому тикет находится по ID канала без разбора
+    его названия. Закрытые заказы уходят в историю.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.by_channel = {}
+        self.load()
+
+    def load(self):
+        """Загрузка открытых заказов из хранилища"""
+        self.by_channel = {}
+        for channel_id, order_info in self.storage.load_orders().items():
+            self._index(channel_id, order_info)
+
+    def _index(self, channel_id, order_info):
+        self.by_channel[str(channel_id)] = order_info
+
+    def get(self, channel_id):
+        """Информация об открытом заказе по ID канала"""
+        return self.by_channel.get(str(channel_id))
+
+    def open(self, channel_id, buyer_id, cart, details):
+        """Регистрация нового заказа
+
+        cart - снимок корзины, details - данные формы заказа.
+        """
+        order_info = {
+            "buyer_id": buyer_id,
+            "lines": cart.to_lines(),
+            "total": cart.total,
+            "count": cart.count,
+            **details,
+            "created_at": datetime.now().isoformat(),
+            "status": "open"
+        }
+        self._index(channel_id, order_info)
+        self.storage.save_order(channel_id, order_info)
+        return order_info
+
+    def cancel(self, channel_id):
+        """Отмена заказа, тикет которого не удалось создать"""
+        return self.close(channel_id, None, status="cancelled")
+
+    def close(self, channel_id, closed_by, status="closed"):
+        """Закрытие заказа и перенос его в историю"""
+        order_info = self.by_channel.pop(str(channel_id), None)
+        if not order_info:
+            return None
+        order_info["status"] = status
+        order_info["closed_at"] = datetime.now().isoformat()
+        order_info["closed_by"] = closed_by
+        self.storage.archive_order(channel_id, order_info)
+        return order_info
+
+_registry = None
+_order_registry = None
+
+def get_exchange_registry():
+    """Общий для всего процесса реестр тикетов сделок"""
+    global _registry
+    if _registry is None:
+        _registry = ExchangeRegistry(get_storage())
+    return _registry
+
+def get_order_registry():
+    """Общий для всего процесса реестр тикетов заказов"""
+    global _order_registry
+    if _order_registry is None:
+        _order_registry = OrderRegistry(get_storage())
+    return _order_registry
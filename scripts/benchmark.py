@@ -0,0 +1,539 @@
+"""Нагрузочный прогон модулей бота без сервера Discord
+
+Модули магазина и сделок запускаются против имитации сервера: каналы,
+сообщения и взаимодействия заменены объектами в памяти, а каждый запрос
+к Discord проходит через имитацию REST с задержкой и ответами 429.
+
+Запуск из корня проекта:
+    python scripts/benchmark.py
+    python scripts/benchmark.py --scenario cart_clicks --clicks 20000 --latency 80
+    python scripts/benchmark.py --json results.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ID объектов имитируемого сервера
+GUILD_ID = 1
+SHOP_CHANNEL_ID = 10
+CART_CHANNEL_ID = 11
+ADMIN_CHANNEL_ID = 12
+REVIEW_CHANNEL_ID = 13
+TICKET_CATEGORY_ID = 20
+ARCHIVE_CATEGORY_ID = 21
+
+SCENARIOS = ("cart_clicks", "checkout_burst", "update_shop", "exchange_churn")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон модулей бота")
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append", help="Сценарий (по умолчанию все)")
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--latency", type=float, default=50.0, help="Средняя задержка REST, мс")
+    parser.add_argument("--jitter", type=float, default=15.0, help="Разброс задержки REST, мс")
+    parser.add_argument("--rate-limit", type=float, default=0.01, help="Доля запросов с ответом 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Ожидание после 429, с")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--clicks", type=int, default=10000)
+    parser.add_argument("--checkouts", type=int, default=200)
+    parser.add_argument("--exchanges", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=100, help="Одновременных операций")
+    parser.add_argument("--pool", type=int, default=3, help="Размер запаса каналов тикетов")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Файл для сохранения результатов")
+    return parser.parse_args()
+
+def prepare_environment(args):
+    """Изолированная папка данных и настройки до импорта модулей"""
+    workdir = tempfile.mkdtemp(prefix="keepershop-bench-")
+    os.chdir(workdir)
+    os.environ.update({
+        "GUILD_ID": str(GUILD_ID),
+        "SHOP_CHANNEL_ID": str(SHOP_CHANNEL_ID),
+        "CART_CHANNEL_ID": str(CART_CHANNEL_ID),
+        "ADMIN_CHANNEL_ID": str(ADMIN_CHANNEL_ID),
+        "REVIEW_CHANNEL_ID": str(REVIEW_CHANNEL_ID),
+        "TICKET_CATEGORY_ID": str(TICKET_CATEGORY_ID),
+        "ARCHIVE_CATEGORY_ID": str(ARCHIVE_CATEGORY_ID),
+        "TICKET_POOL_SIZE": str(args.pool),
+        "STORAGE_BACKEND": args.storage,
+        "METRICS_PORT": "",
+    })
+    sys.path.insert(0, ROOT)
+    return workdir
+
+args = parse_args()
+WORKDIR = prepare_environment(args)
+
+import discord
+
+from modules.metrics import Histogram, metrics, record_http_response
+from modules.guild_config import get_guild_cache
+from modules.persistence import flush_writes
+from modules.ticket_pool import get_ticket_pool
+from modules import shop_system
+from modules import exchange_system
+
+# Имитация REST API, создаётся в main()
+rest = None
+
+class FakeHttpResponse:
+    def __init__(self, status, reason):
+        self.status = status
+        self.reason = reason
+
+class FakeRest:
+    """Имитация REST API: задержка, ответы 429 и подсчёт запросов по маршрутам"""
+
+    def __init__(self, latency, jitter, rate_limit, retry_after):
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.rate_limited = 0
+
+    def reset(self):
+        self.calls.clear()
+        self.rate_limited = 0
+
+    async def call(self, route):
+        self.calls[route] += 1
+        # Как и discord.py, после 429 запрос повторяется через retry_after;
+        # каждый ответ замеряется так же, как трассировкой HTTP бота
+        while random.random() < self.rate_limit:
+            self.rate_limited += 1
+            record_http_response(route, 429, 0.0)
+            await asyncio.sleep(self.retry_after)
+        started = time.perf_counter()
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        record_http_response(route, 200, time.perf_counter() - started)
+
+snowflakes = itertools.count()
+
+def next_snowflake():
+    return discord.utils.time_snowflake(discord.utils.utcnow()) + next(snowflakes) % 4096
+
+class FakeRole:
+    def __init__(self, role_id, name, administrator=False):
+        self.id = role_id
+        self.name = name
+        self.permissions = discord.Permissions(administrator=administrator)
+        self.mention = f"<@&{role_id}>"
+
+class FakeMember:
+    def __init__(self, member_id, name, administrator=False, bot=False):
+        self.id = member_id
+        self.name = name
+        self.bot = bot
+        self.mention = f"<@{member_id}>"
+        self.guild_permissions = discord.Permissions(administrator=administrator)
+
+    async def add_roles(self, *roles):
+        await rest.call("add_roles")
+
+class FakeMessage:
+    def __init__(self, channel, author, content=None, embeds=None, view=None):
+        self.id = next_snowflake()
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.embeds = embeds or []
+        self.view = view
+
+    async def edit(self, content=None, embed=None, embeds=None, view=None):
+        await rest.call("edit_message")
+        if embed is not None:
+            self.embeds = [embed]
+        elif embeds is not None:
+            self.embeds = embeds
+        self.view = view
+        return self
+
+    async def delete(self):
+        await rest.call("delete_message")
+        self.channel.messages.pop(self.id, None)
+
+class FakePartialMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    def _resolve(self):
+        message = self.channel.messages.get(self.id)
+        if message is None:
+            raise discord.NotFound(FakeHttpResponse(404, "Not Found"), "Unknown Message")
+        return message
+
+    async def edit(self, **kwargs):
+        return await self._resolve().edit(**kwargs)
+
+    async def delete(self):
+        await self._resolve().delete()
+
+class FakeTextChannel:
+    def __init__(self, guild, channel_id, name, category=None, overwrites=None, topic=None):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.category = category
+        self.topic = topic
+        self._overwrites = dict(overwrites or {})
+        self.messages = {}
+        self.mention = f"<#{channel_id}>"
+
+    @property
+    def overwrites(self):
+        return {target: discord.PermissionOverwrite(**dict(overwrite)) for target, overwrite in self._overwrites.items()}
+
+    async def send(self, content=None, embed=None, embeds=None, view=None, **kwargs):
+        await rest.call("send_message")
+        message = FakeMessage(self, self.guild.me, content, [embed] if embed else embeds, view)
+        self.messages[message.id] = message
+        return message
+
+    def get_partial_message(self, message_id):
+        return FakePartialMessage(self, message_id)
+
+    async def delete_messages(self, messages):
+        await rest.call("bulk_delete")
+        for message in messages:
+            self.messages.pop(message.id, None)
+
+    async def history(self, limit=100):
+        for message in list(self.messages.values())[-limit:]:
+            yield message
+
+    async def edit(self, name=None, overwrites=None, topic=None, category=None):
+        await rest.call("edit_channel")
+        if name is not None:
+            self.name = name
+        if overwrites is not None:
+            self._overwrites = dict(overwrites)
+        self.topic = topic
+        if category is not None:
+            self.category = category
+        return self
+
+    async def delete(self):
+        await rest.call("delete_channel")
+        self.guild.channels.pop(self.id, None)
+
+class FakeCategory(discord.CategoryChannel):
+    """Категория, проходящая проверку isinstance(..., discord.CategoryChannel)"""
+
+    def __init__(self, guild, category_id, name):
+        self.guild = guild
+        self.id = category_id
+        self.name = name
+
+    @property
+    def text_channels(self):
+        return [channel for channel in self.guild.channels.values()
+                if isinstance(channel, FakeTextChannel) and channel.category is self]
+
+    async def create_text_channel(self, name, overwrites=None, topic=None, **kwargs):
+        await rest.call("create_channel")
+        channel = FakeTextChannel(self.guild, next_snowflake(), name, self, overwrites, topic)
+        self.guild.channels[channel.id] = channel
+        return channel
+
+class FakeGuild:
+    def __init__(self, bot_user):
+        self.id = GUILD_ID
+        self.me = bot_user
+        self.default_role = FakeRole(GUILD_ID, "@everyone")
+        self.roles = [self.default_role, FakeRole(2, "Admin", administrator=True), FakeRole(3, "Участник")]
+        self.members = {}
+        self.channels = {}
+        for channel_id, name in ((SHOP_CHANNEL_ID, "магазин"), (CART_CHANNEL_ID, "корзина"),
+                                 (ADMIN_CHANNEL_ID, "админ"), (REVIEW_CHANNEL_ID, "отзывы")):
+            self.channels[channel_id] = FakeTextChannel(self, channel_id, name)
+        self.channels[TICKET_CATEGORY_ID] = FakeCategory(self, TICKET_CATEGORY_ID, "тикеты")
+        self.channels[ARCHIVE_CATEGORY_ID] = FakeCategory(self, ARCHIVE_CATEGORY_ID, "архив")
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+class FakeBot:
+    """Минимальная замена commands.Bot для модулей"""
+
+    def __init__(self):
+        self.user = FakeMember(999, "KeeperShop", bot=True)
+        self.guild = FakeGuild(self.user)
+
+    def get_guild(self, guild_id):
+        return self.guild if guild_id == GUILD_ID else None
+
+    def get_channel(self, channel_id):
+        return self.guild.get_channel(channel_id)
+
+    def add_listener(self, func, name=None):
+        pass
+
+    def remove_listener(self, func, name=None):
+        pass
+
+    def add_view(self, view):
+        pass
+
+class FakeResponse:
+    def __init__(self):
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def _respond(self, route):
+        await rest.call(route)
+        self.done = True
+
+    async def send_message(self, content=None, **kwargs):
+        await self._respond("interaction_response")
+
+    async def defer(self, **kwargs):
+        await self._respond("interaction_response")
+
+    async def send_modal(self, modal):
+        await self._respond("interaction_response")
+
+    async def edit_message(self, **kwargs):
+        await self._respond("interaction_response")
+
+class FakeFollowup:
+    async def send(self, content=None, **kwargs):
+        await rest.call("followup")
+
+class FakeInteraction:
+    def __init__(self, bot, user, custom_id=None):
+        self.client = bot
+        self.guild = bot.guild
+        self.user = user
+        self.type = discord.InteractionType.component
+        self.data = {"custom_id": custom_id} if custom_id else {}
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+    async def edit_original_response(self, **kwargs):
+        await rest.call("edit_original_response")
+
+def fill_order_form(form):
+    form.coords._value = "100 64 -200"
+    form.dimension._value = "Незер"
+    form.username._value = "player"
+    form.comment._value = ""
+    return form
+
+class ScenarioResult:
+    def __init__(self, name):
+        self.name = name
+        self.latency = Histogram()
+        self.operations = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    async def run(self, operations, concurrency):
+        """Выполнение операций с ограничением одновременности и замером каждой"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def measured(operation):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    await operation()
+                except Exception as e:
+                    self.errors += 1
+                    if self.errors <= 3:
+                        print(f"   ⚠️ Ошибка операции: {e!r}")
+                finally:
+                    self.latency.observe(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(measured(operation) for operation in operations))
+        self.elapsed += time.perf_counter() - start
+        self.operations += len(operations)
+
+    def report(self):
+        throughput = self.operations / self.elapsed if self.elapsed else 0.0
+        spans = {
+            name: {"count": count, "p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "p99_ms": p99 * 1000}
+            for name, (count, p50, p95, p99, _) in metrics.snapshot().items()
+        }
+        return {
+            "scenario": self.name,
+            "operations": self.operations,
+            "errors": self.errors,
+            "seconds": round(self.elapsed, 3),
+            "throughput": round(throughput, 1),
+            "latency_ms": {
+                "p50": round(self.latency.quantile(0.5) * 1000, 2),
+                "p95": round(self.latency.quantile(0.95) * 1000, 2),
+                "p99": round(self.latency.quantile(0.99) * 1000, 2),
+                "max": round(self.latency.max * 1000, 2),
+            },
+            "rest_calls": dict(rest.calls),
+            "rest_total": sum(rest.calls.values()),
+            "rate_limited": rest.rate_limited,
+            "spans": spans,
+        }
+
+def reset_counters():
+    rest.reset()
+    metrics.histograms.clear()
+    metrics.counters.clear()
+
+def flush_carts():
+    """Запись изменённых корзин после сценария; вне бота ожидание записи допустимо"""
+    shop_system.cart_writer.flush()
+    flush_writes()
+
+def make_users(bot, count, offset=0):
+    users = [FakeMember(10_000 + offset + index, f"user{offset + index}") for index in range(count)]
+    for user in users:
+        bot.guild.members[user.id] = user
+    return users
+
+def ensure_items(count):
+    catalog = shop_system.catalog
+    for index in range(len(catalog), count):
+        catalog.add(name=f"Товар {index:04d}", price=random.randint(5, 500), description=f"Описание товара {index}", image="")
+    return list(catalog)
+
+async def scenario_cart_clicks(bot):
+    """Клики по кнопкам товаров: 80% добавление, 20% удаление"""
+    items = ensure_items(min(args.items, 200))
+    users = make_users(bot, args.users)
+    result = ScenarioResult("cart_clicks")
+
+    def click():
+        user = random.choice(users)
+        item = random.choice(items)
+        action = "shop_add_" if random.random() < 0.8 else "shop_remove_"
+        interaction = FakeInteraction(bot, user, f"{action}{item['id']}")
+        return lambda: shop_system.shop_interaction_handler(interaction)
+
+    await result.run([click() for _ in range(args.clicks)], args.concurrency)
+    flush_carts()
+    return result
+
+async def scenario_checkout_burst(bot):
+    """Одновременное оформление заказов с заполненными корзинами"""
+    items = ensure_items(min(args.items, 200))
+    users = make_users(bot, args.checkouts, offset=args.users)
+    for user in users:
+        cart = shop_system.get_cart(str(user.id))
+        for item in random.sample(items, 5):
+            name, price = shop_system.catalog.price(item["id"])
+            cart.add(item["id"], name, price, random.randint(1, 3))
+
+    # Запас каналов заполняется заранее, как при обычной работе
+    pool = get_ticket_pool()
+    pool.start(bot)
+    if pool._refill_task:
+        await pool._refill_task
+    reset_counters()
+
+    result = ScenarioResult("checkout_burst")
+
+    def checkout(user):
+        cart = shop_system.get_cart(str(user.id))
+        form = fill_order_form(shop_system.OrderForm(cart.checkout_token))
+        interaction = FakeInteraction(bot, user)
+        return lambda: form.on_submit(interaction)
+
+    # Все заказы приходят одновременно
+    await result.run([checkout(user) for user in users], len(users))
+    flush_carts()
+    return result
+
+async def scenario_update_shop(bot):
+    """Полная публикация магазина, повторная проверка без изменений и force"""
+    ensure_items(args.items)
+    reset_counters()
+    result = ScenarioResult("update_shop")
+    for force in (False, False, True):
+        await result.run([lambda force=force: shop_system.update_shop(bot, force=force)], 1)
+    return result
+
+async def scenario_exchange_churn(bot):
+    """Открытие и закрытие тикетов сделок"""
+    exchange_system.CLOSE_ARCHIVE_DELAY = 0
+    users = make_users(bot, args.exchanges * 2, offset=args.users + args.checkouts)
+    result = ScenarioResult("exchange_churn")
+
+    def churn(author, partner):
+        async def operation():
+            await exchange_system.create_exchange_ticket(FakeInteraction(bot, author), partner)
+            channel_id = exchange_system.registry.find_between(author.id, partner.id)
+            await exchange_system.close_exchange_ticket(FakeInteraction(bot, author), channel_id)
+        return operation
+
+    pairs = [(users[index], users[index + 1]) for index in range(0, len(users), 2)]
+    await result.run([churn(author, partner) for author, partner in pairs], args.concurrency)
+    return result
+
+def print_report(report):
+    latency = report["latency_ms"]
+    print(f"\n== {report['scenario']}: {report['operations']} оп. за {report['seconds']} с "
+          f"({report['throughput']} оп/с), ошибок: {report['errors']}")
+    print(f"   задержка операции p50/p95/p99/max: {latency['p50']} / {latency['p95']} / "
+          f"{latency['p99']} / {latency['max']} мс")
+    calls = ", ".join(f"{route}={count}" for route, count in sorted(report["rest_calls"].items()))
+    print(f"   REST: всего {report['rest_total']} ({calls}), ответов 429: {report['rate_limited']}")
+    spans = sorted(report["spans"].items(), key=lambda entry: entry[1]["count"], reverse=True)[:8]
+    for name, span in spans:
+        print(f"   {name} ×{span['count']}: {span['p50_ms']:.1f} / {span['p95_ms']:.1f} / {span['p99_ms']:.1f} мс")
+
+async def main():
+    global rest
+    random.seed(args.seed)
+    rest = FakeRest(args.latency, args.jitter, args.rate_limit, args.retry_after)
+
+    bot = FakeBot()
+    get_guild_cache().attach(bot)
+    # Модули не читают данные при импорте: общие объекты привязываются явно,
+    # как при их настройке
+    shop_system.bind_services()
+    exchange_system.bind_services()
+
+    scenarios = {
+        "cart_clicks": scenario_cart_clicks,
+        "checkout_burst": scenario_checkout_burst,
+        "update_shop": scenario_update_shop,
+        "exchange_churn": scenario_exchange_churn,
+    }
+    print(f"Данные прогона: {WORKDIR} (хранилище: {args.storage}, REST: {args.latency}±{args.jitter} мс, "
+          f"429: {args.rate_limit:.1%})")
+
+    reports = []
+    for name in args.scenario or SCENARIOS:
+        reset_counters()
+        result = await scenarios[name](bot)
+        report = result.report()
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(os.path.join(ROOT, args.json) if not os.path.isabs(args.json) else args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "date": datetime.datetime.now().isoformat(),
+                "settings": vars(args),
+                "scenarios": reports
+            }, f, ensure_ascii=False, indent=4)
+
+if __name__ == "__main__":
+    asyncio.run(main())